@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Arrow CSV engine for the pandas-style validators.
+
+pd.read_csv(chunksize=...) parses on one thread and builds a full
+DataFrame per chunk only so its columns can be compared. Here the header
+is parsed once from the first line and checked by the caller. The body is
+then streamed through pyarrow's CSV reader in bounded record batches (about
+ARROW_BLOCK_SIZE bytes each) that are counted and dropped. Only the first
+column is converted; the parser still tokenizes every field, so a row with
+too many fields is an error exactly as in pandas.
+
+pyarrow's streaming reader is single-threaded, so a plain file is mapped
+and split into record-aligned ranges, one streamed per thread. pyarrow
+releases the GIL while parsing, so each range runs on its own core, and
+the ranges are zero-copy slices of Arrow's own mapping of the file.
+Compressed files are decompressed by compression_codecs and streamed as
+one range.
+
+Rows with fewer fields than the header (such as a short trailer row) are
+counted, matching pandas, which pads them with NaN.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from fused_engine import is_mappable, map_file, open_binary, record_ranges
+
+ARROW_BLOCK_SIZE = 4 * 1024 * 1024
+
+
+def count_range(source, delimiter, columns, skip_header, block_size=ARROW_BLOCK_SIZE, progress=None):
+    """Stream one CSV source (a path, a binary file object or a pyarrow Buffer of whole records) and return its row count."""
+    import pyarrow as pa
+    from pyarrow import csv
+
+    short_rows = []
+
+    def on_invalid_row(row):
+        # Pandas pads short rows with NaN but rejects rows with extra fields
+        if row.actual_columns < row.expected_columns:
+            short_rows.append(row.number)
+            return 'skip'
+        return 'error'
+
+    if isinstance(source, pa.Buffer):
+        source = pa.BufferReader(source)
+    reader = csv.open_csv(
+        source,
+        read_options=csv.ReadOptions(block_size=block_size, column_names=columns,
+                                     skip_rows=1 if skip_header else 0),
+        parse_options=csv.ParseOptions(delimiter=delimiter, invalid_row_handler=on_invalid_row),
+        convert_options=csv.ConvertOptions(include_columns=columns[:1], column_types={columns[0]: pa.string()}),
+    )
+    rows = 0
+    for batch in reader:
+        rows += batch.num_rows
+        if progress is not None:
+            progress.rows += batch.num_rows
+    return rows + len(short_rows)
+
+
+def count_rows_arrow(file_path, delimiter, columns, compression=None, threads=None, progress=None):
+    """Count the data rows of the file (header excluded) with Arrow, in parallel ranges for plain files.
+
+    Raises pyarrow.lib.ArrowInvalid when a row cannot be parsed.
+    """
+    threads = threads or os.cpu_count() or 1
+    if compression is not None:
+        # Decompressed by compression_codecs, whatever the file's suffix
+        with open_binary(file_path, compression) as f:
+            return count_range(f, delimiter, columns, skip_header=True, progress=progress)
+    if not is_mappable(file_path, compression) or threads == 1:
+        return count_range(file_path, delimiter, columns, skip_header=True, progress=progress)
+    import pyarrow as pa
+
+    with map_file(file_path) as mm:
+        if mm is None:
+            raise ValueError("File is empty.")
+        header_end = mm.find(b'\n') + 1
+        if header_end == 0:
+            return 0
+        ranges = [(max(start, header_end), end) for start, end in record_ranges(mm, threads) if end > header_end]
+
+    lock = threading.Lock()
+    # Arrow maps the file itself, so the range buffers are zero-copy and
+    # their lifetime is managed by Arrow rather than by Python buffer exports
+    with pa.memory_map(file_path) as source:
+        data = source.read_buffer()
+
+        def count(bounds):
+            start, end = bounds
+            rows = count_range(data.slice(start, end - start), delimiter, columns, skip_header=False)
+            if progress is not None:
+                with lock:
+                    progress.rows += rows
+            return rows
+
+        with ThreadPoolExecutor(max_workers=min(threads, len(ranges))) as pool:
+            return sum(pool.map(count, ranges))
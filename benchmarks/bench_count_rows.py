@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark for row counting: text-mode line iteration vs the binary scan.
+
+Writes a synthetic pipe-delimited feed (plain and gzip) to a temporary
+directory, then counts its lines with the original count_rows loop,
+sum(1 for _ in f) over a text-mode file, and with fused_engine.scan_file,
+which the validators now count with. Both run on the same inputs in this
+process; the counts must agree, and the time and speedup are printed for
+each input. Only feedgen and fused_engine are imported, so the baseline
+is measured without the validators' own imports.
+
+Usage: python benchmarks/bench_count_rows.py [rows] [columns]
+"""
+
+import gzip
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from feedgen import write_feed
+from fused_engine import scan_file
+
+
+def count_text_lines(file_path, compression):
+    """The original count_rows loop."""
+    if compression == 'gzip':
+        with gzip.open(file_path, 'rt') as f:
+            return sum(1 for _ in f)
+    with open(file_path, 'rt') as f:
+        return sum(1 for _ in f)
+
+
+def count_scanned_lines(file_path, compression, check_delimiter):
+    """The line count of the single-pass scan the validators use."""
+    return scan_file(file_path, compression, check_delimiter=check_delimiter)['line_count']
+
+
+def best_of(func, *args, repeat=3):
+    """Return (result, best wall time) over a few runs."""
+    best = None
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        result = func(*args)
+        elapsed_time = time.perf_counter() - start_time
+        best = elapsed_time if best is None else min(best, elapsed_time)
+    return result, best
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    columns = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    with tempfile.TemporaryDirectory() as tmp:
+        for compression in (None, 'gzip'):
+            file_path = os.path.join(tmp, 'feed.psv' + ('.gz' if compression else ''))
+            write_feed(file_path, rows, columns, compression=compression)
+            size_mb = os.path.getsize(file_path) / (1024 * 1024)
+            text_count, text_time = best_of(count_text_lines, file_path, compression)
+            count_only, count_time = best_of(count_scanned_lines, file_path, compression, False)
+            checked, checked_time = best_of(count_scanned_lines, file_path, compression, True)
+            assert text_count == count_only == checked, (text_count, count_only, checked)
+            print("="*60)
+            print(f"{compression or 'plain'}: {size_mb:.1f} MB on disk, {text_count:,} lines")
+            print(f"  text iteration:            {text_time:.3f} s")
+            print(f"  scan_file:                 {count_time:.3f} s  (speedup {text_time / count_time:.1f}x)")
+            print(f"  scan_file with delimiters: {checked_time:.3f} s  (speedup {text_time / checked_time:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
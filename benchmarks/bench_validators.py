@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark every validator on the same synthetic feeds.
+
+Each combination of row count, column count, field width, delimiter,
+compression and trailer semantics is generated once with feedgen, then
+every validator that applies to it is run in a fresh child process so its
+peak RSS is measured on its own. Validator console output goes to
+/dev/null and the result cache is off, so every run does the full work.
+
+Progress and comparisons go to stderr. Results are written as JSON (one
+record per validator and input, plus the commit and interpreter they were
+measured on) so runs on different commits can be compared with --compare.
+
+Usage:
+    python benchmarks/bench_validators.py --rows 1000000 --columns 5 50 --compression none gzip
+    python benchmarks/bench_validators.py --output new.json --compare old.json
+"""
+
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+sys.path.insert(0, ROOT)
+
+from feedgen import TRAILER_MODES, write_expected_columns, write_feed
+
+# name -> (script, function, trailer mode it validates or None for any input)
+VALIDATORS = {
+    'pandas': ("validator.py", 'validate_file', None),
+    'pandas-compress-infer': ("validator with pandas inbuilt compress infering.py", 'validate_file', None),
+    'pandas-expected-columns': ("validator_pandas_inbuilt_compress_infering_expected_col_file.py",
+                                'validate_file', None),
+    'validator2-pandas': ("validator 2.py", 'validate_file_pandas', None),
+    'validator2-duckdb': ("validator 2.py", 'validate_file_duckdb', 'excluding-header'),
+    'trailer-all': ("untitled4_validator_ all records count.py", 'validate_file', 'all'),
+    'trailer-excluding-header': ("untitled7_validator_all records count excluding header_1.py",
+                                 'validate_file', 'excluding-header'),
+}
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process (ru_maxrss is KB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def run_child(name, file_path, expected_columns_path):
+    """Run one validator on one file in this process and print a JSON result line."""
+    from progress import set_quiet
+    from validate_cli import load_validator
+
+    set_quiet()
+
+    script, function_name, _ = VALIDATORS[name]
+    result = {'validator': name}
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            module = load_validator(script, 'bench_' + name.replace('-', '_'))
+            module.EXPECTED_COLUMNS_FILE = expected_columns_path
+            if hasattr(module, 'USE_RESULT_CACHE'):
+                module.USE_RESULT_CACHE = False
+            validate = getattr(module, function_name)
+            start_time = time.perf_counter()
+            valid = validate(file_path)
+            result['wall_s'] = time.perf_counter() - start_time
+        result['valid'] = bool(valid[0] if isinstance(valid, tuple) else valid)
+    except BaseException as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    result['peak_rss_bytes'] = peak_rss_bytes()
+    print(json.dumps(result))
+
+
+def measure(name, file_path, expected_columns_path, work_dir, repeat):
+    """Run a validator `repeat` times in fresh processes; keep the best wall time and the highest RSS."""
+    best = None
+    for _ in range(repeat):
+        # The child runs in the scratch directory so any ledger or CSV it writes stays there
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child', name, file_path, expected_columns_path],
+            cwd=work_dir, capture_output=True, text=True,
+        )
+        lines = output.stdout.strip().splitlines()
+        if output.returncode != 0 or not lines:
+            stderr = output.stderr.strip().splitlines()
+            return {'validator': name, 'error': stderr[-1] if stderr else 'no output'}
+        result = json.loads(lines[-1])
+        if 'error' in result:
+            return result
+        if best is None:
+            best = result
+        else:
+            best['wall_s'] = min(best['wall_s'], result['wall_s'])
+            best['peak_rss_bytes'] = max(best['peak_rss_bytes'], result['peak_rss_bytes'])
+    return best
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_benchmarks(args):
+    records = []
+    cases = itertools.product(args.rows, args.columns, args.field_width, args.delimiter,
+                              args.compression, args.trailer)
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows, columns, field_width, delimiter, compression, trailer in cases:
+            compression = None if compression == 'none' else compression
+            name = f"feed_{rows}_{columns}_{field_width}_{'pipe' if delimiter == '|' else 'comma'}_{trailer}"
+            file_path = os.path.join(tmp, name + ('.psv.gz' if compression else '.psv'))
+            uncompressed_bytes = write_feed(file_path, rows, columns, field_width, delimiter,
+                                            compression, trailer)
+            expected_columns_path = os.path.join(tmp, f"expected_columns_{columns}.txt")
+            write_expected_columns(expected_columns_path, columns)
+            case = {
+                'rows': rows, 'columns': columns, 'field_width': field_width, 'delimiter': delimiter,
+                'compression': compression or 'none', 'trailer': trailer,
+                'file_bytes': os.path.getsize(file_path), 'uncompressed_bytes': uncompressed_bytes,
+            }
+            for validator in args.validators:
+                if VALIDATORS[validator][2] not in (None, trailer):
+                    continue
+                result = measure(validator, file_path, expected_columns_path, tmp, args.repeat)
+                record = dict(case, **result)
+                if 'wall_s' in record and record['wall_s'] > 0:
+                    record['mb_per_s'] = uncompressed_bytes / (1024 * 1024) / record['wall_s']
+                    record['rows_per_s'] = rows / record['wall_s']
+                records.append(record)
+                print(format_record(record), file=sys.stderr)
+            os.remove(file_path)
+    return records
+
+
+def format_record(record):
+    label = (f"{record['validator']:<26} {record['rows']:>10,} rows x {record['columns']:<3} "
+             f"{record['compression']:<5} {record['trailer']:<17}")
+    if 'error' in record:
+        return f"{label} error: {record['error']}"
+    return (f"{label} {record['wall_s']:8.3f} s {record['mb_per_s']:8.1f} MB/s "
+            f"{record['rows_per_s']:12,.0f} rows/s {record['peak_rss_bytes'] / (1024 * 1024):8.1f} MB RSS"
+            f"{'' if record['valid'] else '  (INVALID)'}")
+
+
+def record_key(record):
+    return tuple(record[k] for k in ('validator', 'rows', 'columns', 'field_width', 'delimiter',
+                                     'compression', 'trailer'))
+
+
+def compare(baseline, records):
+    """Print wall-time and RSS ratios against an earlier results file."""
+    earlier = {record_key(record): record for record in baseline['results'] if 'wall_s' in record}
+    print("="*60, file=sys.stderr)
+    print(f"Compared with {baseline.get('commit') or 'baseline'} (speedup > 1 means faster now)", file=sys.stderr)
+    for record in records:
+        before = earlier.get(record_key(record))
+        if before is None or 'wall_s' not in record:
+            continue
+        print(f"{record['validator']:<26} {record['rows']:>10,} x {record['columns']:<3} "
+              f"{record['compression']:<5} {record['trailer']:<17} "
+              f"speedup {before['wall_s'] / record['wall_s']:5.2f}x  "
+              f"RSS {record['peak_rss_bytes'] / before['peak_rss_bytes']:5.2f}x", file=sys.stderr)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the validators on synthetic feeds.")
+    parser.add_argument('--rows', type=int, nargs='+', default=[100_000])
+    parser.add_argument('--columns', type=int, nargs='+', default=[5, 50])
+    parser.add_argument('--field-width', type=int, nargs='+', default=[8])
+    parser.add_argument('--delimiter', nargs='+', choices=['|', ','], default=['|', ','])
+    parser.add_argument('--compression', nargs='+', choices=['none', 'gzip'], default=['none', 'gzip'])
+    parser.add_argument('--trailer', nargs='+', choices=TRAILER_MODES, default=list(TRAILER_MODES))
+    parser.add_argument('--validators', nargs='+', choices=list(VALIDATORS), default=list(VALIDATORS))
+    parser.add_argument('--repeat', type=int, default=3, help="runs per validator and input; the best is kept")
+    parser.add_argument('--output', help="write the JSON results here instead of stdout")
+    parser.add_argument('--compare', help="earlier JSON results to compare against")
+    args = parser.parse_args(argv)
+    if min(args.columns) < 3:
+        parser.error("--columns must be at least 3 so the trailer fits in a row")
+    return args
+
+
+def main():
+    if len(sys.argv) == 5 and sys.argv[1] == '--child':
+        run_child(*sys.argv[2:])
+        return
+    args = parse_args()
+    records = run_benchmarks(args)
+    report = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'results': records,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), records)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Synthetic feed generator for the benchmarks.
+
+Writes a header, data rows and an optional trailer whose third field holds
+the record count in either of the two conventions the validators support:
+'all' (every line but the trailer, as untitled4 expects) or
+'excluding-header' (data rows only, as untitled7 expects). Output is
+deterministic for a given seed, so runs on different commits read the
+same bytes.
+
+Usage: python benchmarks/feedgen.py OUTPUT [rows] [columns] [field_width] [delimiter] [trailer]
+"""
+
+import gzip
+import random
+import string
+import sys
+
+TRAILER_MODES = ('all', 'excluding-header')
+# Rows are drawn from a pool of distinct lines so generation stays cheap
+ROW_POOL_SIZE = 4096
+WRITE_BATCH = 1024
+
+
+def trailer_count(rows, trailer):
+    """Return the record count a trailer should carry for the given count semantics."""
+    if trailer == 'all':
+        return rows + 1
+    if trailer == 'excluding-header':
+        return rows
+    raise ValueError(f"Unknown trailer mode: {trailer}")
+
+
+def column_names(columns):
+    return [f"col{i}" for i in range(columns)]
+
+
+def write_feed(file_path, rows, columns, field_width=8, delimiter='|', compression=None,
+               trailer='all', seed=0):
+    """Write a synthetic feed and return the number of uncompressed bytes written.
+
+    trailer is 'all', 'excluding-header' or None for no trailer row. The
+    trailer has three fields, so columns must be at least 3 for the pandas
+    engines to read it as a short row.
+    """
+    rng = random.Random(seed)
+    alphabet = string.ascii_letters + string.digits
+    pool = [
+        delimiter.join("".join(rng.choices(alphabet, k=field_width)) for _ in range(columns)) + "\n"
+        for _ in range(min(rows, ROW_POOL_SIZE) or 1)
+    ]
+    opener = gzip.open if compression == 'gzip' else open
+    written = 0
+    with opener(file_path, 'wb') as f:
+        header = (delimiter.join(column_names(columns)) + "\n").encode()
+        f.write(header)
+        written += len(header)
+        for start in range(0, rows, WRITE_BATCH):
+            batch = "".join(pool[i % len(pool)] for i in range(start, min(start + WRITE_BATCH, rows))).encode()
+            f.write(batch)
+            written += len(batch)
+        if trailer:
+            line = f"T{delimiter}{rows}{delimiter}{trailer_count(rows, trailer)}\n".encode()
+            f.write(line)
+            written += len(line)
+    return written
+
+
+def write_expected_columns(file_path, columns):
+    """Write an expected_columns.txt matching the generated header."""
+    with open(file_path, 'w') as f:
+        for name in column_names(columns):
+            f.write(name + "\n")
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__.strip().splitlines()[-1])
+        sys.exit(2)
+    file_path = sys.argv[1]
+    rows = int(sys.argv[2]) if len(sys.argv) > 2 else 1_000_000
+    columns = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+    field_width = int(sys.argv[4]) if len(sys.argv) > 4 else 8
+    delimiter = sys.argv[5] if len(sys.argv) > 5 else '|'
+    trailer = sys.argv[6] if len(sys.argv) > 6 else 'all'
+    compression = 'gzip' if file_path.endswith('.gz') else None
+    written = write_feed(file_path, rows, columns, field_width, delimiter, compression,
+                         None if trailer == 'none' else trailer)
+    print(f"Wrote {file_path}: {rows:,} rows, {written / (1024 * 1024):.1f} MB uncompressed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compressed feed detection and streaming decompression.
+
+The validators used to recognise only gzip, and only by a '.gz' suffix.
+Here detect_compression reads a file's first bytes and names its format:
+gzip, bz2, xz, zip (a single-member archive) or zstd. open_compressed
+streams any of them through one binary reader interface, with
+READ_BUFFER_SIZE buffering, so the scan engine, trailer reader and pandas
+validators read every format the same way.
+
+Each format lists its decoders fastest first. The first one whose module
+imports is used: ISA-L (the isal package) for gzip, falling back to zlib;
+and the stdlib compression.zstd, zstandard or pyzstd for zstd.
+bz2, xz and zip use the standard library. A zstd feed with none of its
+packages installed is reported as an error, not misread.
+"""
+
+import importlib
+import io
+import os
+import stat
+import zlib
+
+READ_BUFFER_SIZE = 1024 * 1024
+MAGIC_BYTES = (
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'xz'),
+    (b'PK\x03\x04', 'zip'),
+    (b'\x28\xb5\x2f\xfd', 'zstd'),
+)
+MAGIC_LENGTH = max(len(magic) for magic, _ in MAGIC_BYTES)
+# Used for pipes and other inputs whose first bytes cannot be read twice
+SUFFIXES = {'.gz': 'gzip', '.bz2': 'bz2', '.xz': 'xz', '.zip': 'zip', '.zst': 'zstd'}
+
+
+def detect_compression(file_path):
+    """Return 'gzip', 'bz2', 'xz', 'zip' or 'zstd' from the file's magic bytes, or None for plain text."""
+    if not stat.S_ISREG(os.stat(file_path).st_mode):
+        return SUFFIXES.get(os.path.splitext(file_path)[1].lower())
+    with open(file_path, 'rb') as f:
+        head = f.read(MAGIC_LENGTH)
+    for magic, compression in MAGIC_BYTES:
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def open_isal_gzip(file_path):
+    from isal import igzip
+    return igzip.open(file_path, 'rb')
+
+
+def open_zlib_gzip(file_path):
+    import gzip
+    return gzip.open(file_path, 'rb')
+
+
+def open_bz2(file_path):
+    import bz2
+    return bz2.open(file_path, 'rb')
+
+
+def open_xz(file_path):
+    import lzma
+    return lzma.open(file_path, 'rb')
+
+
+def open_zip(file_path):
+    import zipfile
+    with zipfile.ZipFile(file_path) as archive:
+        members = [info for info in archive.infolist() if not info.is_dir()]
+        if len(members) != 1:
+            raise ValueError(f"Zip archive must hold exactly one file, found {len(members)}.")
+        # The member keeps the archive's file open after the archive is closed
+        return archive.open(members[0])
+
+
+def open_stdlib_zstd(file_path):
+    from compression import zstd
+    return zstd.open(file_path, 'rb')
+
+
+def open_zstandard(file_path):
+    import zstandard
+    return zstandard.ZstdDecompressor().stream_reader(open(file_path, 'rb'), read_size=READ_BUFFER_SIZE,
+                                                      closefd=True)
+
+
+def open_pyzstd(file_path):
+    import pyzstd
+    return pyzstd.open(file_path, 'rb')
+
+
+# Fastest first: (decoder name, module that must import, opener)
+DECODERS = {
+    'gzip': (('isal', 'isal', open_isal_gzip), ('zlib', 'gzip', open_zlib_gzip)),
+    'bz2': (('bz2', 'bz2', open_bz2),),
+    'xz': (('lzma', 'lzma', open_xz),),
+    'zip': (('zipfile', 'zipfile', open_zip),),
+    'zstd': (('compression.zstd', 'compression.zstd', open_stdlib_zstd),
+             ('zstandard', 'zstandard', open_zstandard),
+             ('pyzstd', 'pyzstd', open_pyzstd)),
+}
+# compression -> (name, opener) of the decoder picked on first use
+_selected = {}
+
+
+def select_decoder(compression):
+    """Return (name, opener) of the fastest installed decoder for the format."""
+    if compression in _selected:
+        return _selected[compression]
+    if compression not in DECODERS:
+        raise ValueError(f"Unsupported compression: {compression}")
+    for name, module_name, opener in DECODERS[compression]:
+        try:
+            importlib.import_module(module_name)
+        except ImportError:
+            continue
+        _selected[compression] = name, opener
+        return name, opener
+    raise ValueError(f"No {compression} decoder installed; install one of: "
+                     f"{', '.join(name for name, _, _ in DECODERS[compression])}.")
+
+
+def decoder_name(compression):
+    """Name of the decoder used for the format, for logs; 'none' for plain files."""
+    if compression is None:
+        return 'none'
+    return select_decoder(compression)[0]
+
+
+def gzip_decompressobj():
+    """Return a streaming gzip decompressor (zlib's decompressobj interface) from the selected gzip decoder."""
+    if select_decoder('gzip')[0] == 'isal':
+        from isal import isal_zlib
+        return isal_zlib.decompressobj(zlib.MAX_WBITS | 16)
+    return zlib.decompressobj(zlib.MAX_WBITS | 16)
+
+
+def open_compressed(file_path, compression, buffer_size=READ_BUFFER_SIZE):
+    """Open the file for binary reading, decompressing it on the fly when compression is set."""
+    if compression is None:
+        return open(file_path, 'rb', buffering=buffer_size)
+    _, opener = select_decoder(compression)
+    return io.BufferedReader(opener(file_path), buffer_size=buffer_size)
+
+
+def open_text(file_path, compression=None, encoding='utf-8'):
+    """Open the file as text, decompressing it on the fly when compression is set."""
+    return io.TextIOWrapper(open_compressed(file_path, compression), encoding=encoding)
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Trailer control totals, computed in the counting scan.
+
+Besides the record count, a trailer can carry control totals: the sum of
+an amount column, or a hash total (the sum of a numeric key column, kept
+to the width of its trailer field). The validators list them in
+CONTROL_TOTALS as (kind, column, trailer field) and control_total_rule
+compares each with its trailer field.
+
+Checking them used to take a second full read downstream. scan_with_totals
+returns everything scan_file does and the column totals too, so one pass
+gives the line count, trailer, delimiter check and totals. Each block of
+the scan gets the usual segment summary. NumPy then locates its newlines
+and delimiters, slices out the totalled fields of every row with the right
+field count, and parses each column as fixed-point decimals in one
+vectorized step. Python only sees rows that cannot be totalled and the few
+lines at block edges. Without NumPy the rows are split and parsed one at a
+time.
+
+The totals are part of the segment summary (see ColumnTotals), so they
+merge in file order like the line counts. The scan therefore takes the
+same paths as scan_file: mmap ranges split across workers, gzip index
+ranges and multi-member gzip files inflated in parallel.
+
+Totals are exact. Values are int64 at TOTAL_DECIMALS places, each block
+is summed in two halves so it cannot overflow, and the running totals are
+Python ints. An empty field counts as zero. The header line and the
+trailer are not totalled.
+
+With no columns to total, the same pass is the per-row field-count check:
+every data line's delimiter count is compared with the header's, and the
+lines that differ are reported.
+"""
+
+import re
+
+from fused_engine import block_segment, delimiter_from_line, open_binary, parse_header, scan_file
+
+TOTALS_BLOCK_SIZE = 4 * 1024 * 1024
+TOTAL_DECIMALS = 6  # Decimal places kept for every value; a value with more cannot be totalled
+MAX_DIGITS = 18  # Integer plus decimal digits that fit in an int64
+MAX_REPORTED = 100
+HALF = 10 ** 9  # Block sums are split at this unit so a block of values cannot overflow int64
+FIELD_WIDTH = MAX_DIGITS + 2  # Digits, a sign and a decimal point
+NUMBER = re.compile(rb'[+-]?(\d*)(?:\.(\d*))?')
+
+
+def parse_number(field, decimals=TOTAL_DECIMALS):
+    """Return the field as an int scaled by 10**decimals, or None if it is not a decimal number."""
+    if not field:
+        return 0
+    match = NUMBER.fullmatch(field)
+    if match is None:
+        return None
+    whole, fraction = match.group(1), match.group(2) or b''
+    if not whole + fraction or len(fraction) > decimals or len(whole) + decimals > MAX_DIGITS:
+        return None
+    value = int(whole + fraction.ljust(decimals, b'0'))
+    return -value if field[:1] == b'-' else value
+
+
+def parse_fields(arr, starts, ends, np, decimals=TOTAL_DECIMALS):
+    """Parse the fields arr[starts[i]:ends[i]] like parse_number; return (int64 values, valid mask).
+
+    arr must extend FIELD_WIDTH bytes past the last field. The fields are
+    gathered one character position per row, so each step below is a few
+    whole-array operations per character of the widest field.
+    """
+    lengths = ends - starts
+    valid = lengths <= FIELD_WIDTH
+    values = np.zeros(len(starts), np.int64)
+    width = int(min(lengths.max(initial=0), FIELD_WIDTH))
+    if not width:
+        return values, valid
+    chars = arr[starts + np.arange(width)[:, None]]
+    inside = np.arange(width)[:, None] < lengths
+    digit = chars - ord('0')  # Wraps past 9 for every other byte
+    digits = (digit < 10) & inside
+    dots = (chars == ord('.')) & inside
+    filled = lengths > 0
+    negative = filled & (chars[0] == ord('-'))
+    signed = negative | (filled & (chars[0] == ord('+')))
+    digit_count = digits.sum(axis=0)
+    dot_count = dots.sum(axis=0)
+    # Position of the point; only meaningful with exactly one, which valid requires
+    dot_at = (dots * np.arange(width)[:, None]).sum(axis=0)
+    fraction = np.where(dot_count > 0, lengths - dot_at - 1, 0)
+    # Only a leading sign may be neither a digit nor the point
+    valid &= lengths - digit_count - dot_count == signed
+    valid &= (dot_count <= 1) & ((digit_count > 0) | ~filled)
+    valid &= (fraction <= decimals) & (digit_count - fraction + decimals <= MAX_DIGITS)
+    for position in range(width):
+        values = np.where(digits[position], values * 10 + digit[position], values)
+    values *= (10 ** np.arange(MAX_DIGITS + 1, dtype=np.int64))[(decimals - fraction).clip(0, MAX_DIGITS)]
+    values = np.where(negative, -values, values)
+    values[~valid] = 0
+    return values, valid
+
+
+def block_rows(arr, delim, columns, expected_delimiters, np):
+    """Parse the totalled columns of every line in a run of complete lines.
+
+    Returns (values, ok, delimiters): values[i] holds column i's value per
+    line, ok marks lines with the expected field count whose values all
+    parse, and delimiters is each line's delimiter count.
+    """
+    newlines = np.flatnonzero(arr == 10)
+    if len(arr) and arr[-1] != 10:
+        # The file's last line has no newline; end it at the end of the block
+        newlines = np.append(newlines, len(arr))
+    starts = np.concatenate(([0], newlines[:-1] + 1))
+    delims = np.flatnonzero(arr == delim)
+    before = np.searchsorted(delims, newlines)
+    first = np.concatenate(([0], before[:-1]))
+    delimiters = before - first
+    ok = delimiters == expected_delimiters
+    rows = np.flatnonzero(ok)
+    padded = np.concatenate((arr, np.zeros(FIELD_WIDTH, np.uint8))) if columns else None
+    values = []
+    for column in columns:
+        field_starts = starts[rows] if column == 0 else delims[first[rows] + column - 1] + 1
+        if column == expected_delimiters:
+            field_ends = newlines[rows]
+            carriage = field_ends > field_starts
+            carriage[carriage] = arr[field_ends[carriage] - 1] == 13
+            field_ends = field_ends - carriage
+        else:
+            field_ends = delims[first[rows] + column]
+        column_values, valid = parse_fields(padded, field_starts, field_ends, np)
+        ok[rows[~valid]] = False
+        line_values = np.zeros(len(newlines), np.int64)
+        line_values[rows] = column_values
+        values.append(line_values)
+    return values, ok, delimiters
+
+
+def block_rows_python(block, delim, columns, expected_delimiters):
+    """block_rows without NumPy: split and parse one line at a time."""
+    lines = bytes(block).split(b'\n')
+    if not lines[-1]:
+        lines.pop()
+    values = [[0] * len(lines) for _ in columns]
+    ok = [False] * len(lines)
+    delimiters = [line.count(delim) for line in lines]
+    for i, line in enumerate(lines):
+        fields = line.rstrip(b'\r').split(delim)
+        if len(fields) != expected_delimiters + 1:
+            continue
+        parsed = [parse_number(fields[column]) for column in columns]
+        if None in parsed:
+            continue
+        ok[i] = True
+        for column_values, value in zip(values, parsed):
+            column_values[i] = value
+    return values, ok, delimiters
+
+
+def load_numpy():
+    """Return the numpy module, or None when it is not installed."""
+    try:
+        import numpy as np
+    except ImportError:
+        return None
+    return np
+
+
+class ColumnTotals:
+    """Totals of some columns, and field counts, kept in segment summaries so they merge like line counts.
+
+    segment() summarises a block as fused_engine.block_segment does and adds
+    totals, bad_lines and bad_count over its body: the complete lines after
+    the head, except the segment's last line. That line and the head may
+    belong to lines that continue in the neighbouring blocks, or be the
+    header or trailer, so they are left out. merge() totals the lines that
+    become complete when two segments are joined: the first segment's last
+    line and the line across the boundary. The merged segment again holds
+    back its own last line. finish() settles the held-back line of the whole
+    file, which is data only when an unterminated trailer follows it.
+
+    Line indexes in bad_lines count the newlines before the line, relative
+    to the segment's start, like bad. The object holds only plain values,
+    so it is sent with the ranges to worker processes.
+    """
+
+    def __init__(self, delimiter, columns, expected_delimiters, max_reported=MAX_REPORTED):
+        self.delim = delimiter.encode()
+        self.columns = tuple(columns)
+        self.expected_delimiters = expected_delimiters
+        self.max_reported = max_reported
+
+    def empty(self):
+        return {'totals': [0] * len(self.columns), 'bad_lines': [], 'bad_count': 0}
+
+    def add_line(self, counts, line, index):
+        """Total one complete line into counts, or record it as bad at the given index."""
+        values, ok, _ = block_rows_python(line, self.delim, self.columns, self.expected_delimiters)
+        if ok[0]:
+            counts['totals'] = [total + column_values[0] for total, column_values in zip(counts['totals'], values)]
+            return
+        counts['bad_count'] += 1
+        if len(counts['bad_lines']) < self.max_reported:
+            counts['bad_lines'] = counts['bad_lines'] + [index]
+
+    def add_lines(self, counts, block, start, end, index, check):
+        """Total the complete lines in block[start:end] into counts; the first has index index.
+
+        Returns the index of the first line without the delimiter when check
+        is set, else None.
+        """
+        np = load_numpy()
+        if np is not None:
+            values, ok, delimiters = block_rows(np.frombuffer(block, np.uint8, end - start, start), self.delim[0],
+                                                self.columns, self.expected_delimiters, np)
+            wrong = np.flatnonzero(~ok)
+            counts['bad_count'] += len(wrong)
+            room = self.max_reported - len(counts['bad_lines'])
+            if room > 0:
+                counts['bad_lines'] = counts['bad_lines'] + [int(i) + index for i in wrong[:room]]
+            for i, column_values in enumerate(values):
+                kept = column_values[ok]
+                counts['totals'][i] += int((kept // HALF).sum()) * HALF + int((kept % HALF).sum())
+            missing = np.flatnonzero(delimiters == 0) if check else ()
+            return int(missing[0]) + index if len(missing) else None
+        values, ok, delimiters = block_rows_python(block[start:end], self.delim, self.columns,
+                                                   self.expected_delimiters)
+        for line, line_ok in enumerate(ok):
+            if line_ok:
+                for i, column_values in enumerate(values):
+                    counts['totals'][i] += column_values[line]
+                continue
+            counts['bad_count'] += 1
+            if len(counts['bad_lines']) < self.max_reported:
+                counts['bad_lines'] = counts['bad_lines'] + [line + index]
+        if check:
+            return next((line + index for line, count in enumerate(delimiters) if not count), None)
+        return None
+
+    def segment(self, block, check=False):
+        """block_segment of a whole block plus the totals of its body.
+
+        With check, bad is found from the delimiter counts the parser makes
+        anyway instead of a regex search.
+        """
+        segment = block_segment(block)
+        segment.update(self.empty())
+        if segment['last'] is None:
+            return segment
+        start = block.find(b'\n') + 1
+        body_end = len(block) - len(segment['tail']) - len(segment['last'])
+        index = 1  # The head's newline comes before the first body line
+        bad = None
+        while start < body_end:
+            # Parsed in record-aligned pieces so the parser's arrays stay small
+            end = block.find(b'\n', min(start + TOTALS_BLOCK_SIZE, body_end) - 1) + 1
+            missing = self.add_lines(segment, block, start, end, index, check and bad is None)
+            bad = missing if bad is None else bad
+            index += block.count(b'\n', start, end)
+            start = end
+        if check and bad is None and self.delim not in segment['last']:
+            bad = segment['newlines'] - 1
+        segment['bad'] = bad
+        return segment
+
+    def merge(self, merged, a, b, joined):
+        """Fill in the totals of merged, the join of segments a and b that both have newlines."""
+        counts = {'totals': list(a['totals']), 'bad_lines': a['bad_lines'], 'bad_count': a['bad_count']}
+        if a['last'] is not None:
+            self.add_line(counts, a['last'], a['newlines'] - 1)
+        if b['last'] is not None:
+            # Otherwise the joined line is the merged segment's last line and stays held back
+            self.add_line(counts, joined, a['newlines'])
+        room = max(self.max_reported - len(counts['bad_lines']), 0)
+        merged['totals'] = [total + other for total, other in zip(counts['totals'], b['totals'])]
+        merged['bad_lines'] = counts['bad_lines'] + [a['newlines'] + i for i in b['bad_lines'][:room]]
+        merged['bad_count'] = counts['bad_count'] + b['bad_count']
+
+    def finish(self, segment):
+        """Return totals, total_bad_lines (1-based) and total_bad_count of a whole-file segment.
+
+        The held-back last line is the trailer and is dropped, unless the
+        file ends in an unterminated trailer after it.
+        """
+        counts = {'totals': list(segment['totals']), 'bad_lines': segment['bad_lines'],
+                  'bad_count': segment['bad_count']}
+        if segment['tail'] and segment['last'] is not None:
+            self.add_line(counts, segment['last'], segment['newlines'] - 1)
+        return {'totals': counts['totals'], 'total_bad_lines': [i + 1 for i in counts['bad_lines']],
+                'total_bad_count': counts['bad_count']}
+
+
+def scan_with_totals(file_path, compression, total_columns, check_delimiter=True, gzip_index=False, workers=1,
+                     progress=None):
+    """scan_file that also totals the named columns and counts every line's fields.
+
+    The result has scan_file's keys plus column_totals, which maps each
+    column found in the header to its exact total scaled by
+    10**TOTAL_DECIMALS, and total_bad_lines / total_bad_count for data
+    lines that have the wrong field count or a value that is not a
+    decimal number. The header is read first to find the columns; the
+    scan itself takes scan_file's mmap, range-split, gzip index and
+    parallel member paths.
+    """
+    with open_binary(file_path, compression) as f:
+        header_line = f.readline().decode('utf-8')
+    if not header_line:
+        raise ValueError("File is empty.")
+    delimiter = delimiter_from_line(header_line)
+    header = parse_header(header_line, delimiter)
+    names = [name for name in dict.fromkeys(total_columns) if name in header]
+    totals = ColumnTotals(delimiter, [header.index(name) for name in names], len(header) - 1)
+    result = scan_file(file_path, compression, check_delimiter=check_delimiter, gzip_index=gzip_index,
+                       workers=workers, progress=progress, totals=totals)
+    result['column_totals'] = dict(zip(names, result.pop('totals')))
+    return result
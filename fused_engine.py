@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Single-pass scan engine shared by the header/trailer validators.
+
+One streaming read of a file gives everything validate_file needs: the
+delimiter, the header columns, the physical line count, the last (trailer)
+line and the first line that is missing the delimiter.
+
+The stream is processed in binary blocks. Each block (or any contiguous
+byte range of the file) is reduced to a small segment summary, and segment
+summaries merge in order, so the same code serves a sequential pass and
+ranges scanned by separate worker processes.
+"""
+
+import csv
+import mmap
+import os
+import re
+import stat
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from compression_codecs import open_compressed
+
+BLOCK_SIZE = 8 * 1024 * 1024
+COUNT_BLOCK_SIZE = 1024 * 1024  # Stays cache-friendly for the newline count
+PARALLEL_MIN_BYTES = 64 * 1024 * 1024  # Smaller plain files are not worth splitting
+
+
+def open_binary(file_path, compression):
+    """Open the file for binary reading, decompressing it on the fly (see compression_codecs.py)."""
+    return open_compressed(file_path, compression)
+
+
+@contextmanager
+def map_file(file_path):
+    """Map a plain file read-only; yields None for an empty file, which cannot be mapped."""
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield None
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            yield mm
+
+
+def is_mappable(file_path, compression):
+    """Only uncompressed regular files go through the mmap path."""
+    return compression is None and stat.S_ISREG(os.stat(file_path).st_mode)
+
+
+def read_blocks(f, block_size=BLOCK_SIZE, progress=None):
+    """Yield successive blocks from a binary file object, adding their sizes to progress.bytes if given.
+
+    Blocks are read with readinto into one reused buffer, so a full block
+    costs no allocation; only a short final read is copied out. The buffer
+    is overwritten by the next read, so a caller that keeps a block past
+    the next one must copy it.
+    """
+    buf = bytearray(block_size)
+    view = memoryview(buf)
+    while True:
+        n = f.readinto(view)
+        if not n:
+            return
+        if progress is not None:
+            progress.bytes += n
+        yield buf if n == block_size else buf[:n]
+
+
+class DelimiterError(ValueError):
+    """The header line names no single delimiter; a property of the file, not of the read."""
+
+
+def delimiter_from_line(line):
+    """Return ',' or '|' for a header line, using the same rules as detect_delimiter."""
+    if ',' in line and '|' in line:
+        raise DelimiterError("File contains both commas and pipes.")
+    elif ',' in line:
+        return ','
+    elif '|' in line:
+        return '|'
+    else:
+        raise DelimiterError("File does not contain a recognized delimiter.")
+
+
+def parse_header(line, delimiter):
+    """Split the header line into column names the way the CSV reader does."""
+    return next(csv.reader([line.rstrip('\r\n')], delimiter=delimiter))
+
+
+def read_header(file_path, delimiter, compression=None):
+    """Return the header columns from the first line of the file."""
+    with open_binary(file_path, compression) as f:
+        line = f.readline()
+    if not line:
+        raise ValueError("File is empty.")
+    return parse_header(line.decode('utf-8'), delimiter)
+
+
+def missing_delimiter_pattern(delimiter):
+    """Compile a pattern matching a complete line that lacks the delimiter."""
+    delim = re.escape(delimiter.encode())
+    return re.compile(b'^[^\\n' + delim + b']*\\n', re.MULTILINE)
+
+
+def count_newlines(buf, start=0, end=None):
+    """Count b'\n' in buf[start:end], where buf is bytes or an mmap.
+
+    With NumPy available the count runs over a zero-copy view of the
+    buffer; otherwise bounded slices are counted one at a time.
+    """
+    end = len(buf) if end is None else end
+    if hasattr(buf, 'count'):
+        return buf.count(b'\n', start, end)
+    try:
+        import numpy as np
+    except ImportError:
+        np = None
+    newlines = 0
+    for pos in range(start, end, COUNT_BLOCK_SIZE):
+        stop = min(pos + COUNT_BLOCK_SIZE, end)
+        if np is not None:
+            newlines += int(np.count_nonzero(np.frombuffer(buf, np.uint8, stop - pos, pos) == 10))
+        else:
+            newlines += buf[pos:stop].count(b'\n')
+    return newlines
+
+
+def block_segment(block, pattern=None, start=0, end=None):
+    """Summarise one block of the stream, or the byte range [start, end) of an mmap.
+
+    A segment records the newline count, the bytes up to and including the
+    first newline (head), the bytes after the last newline (tail), the last
+    complete line after the head (last) and, when pattern is given, the
+    index of the first complete line inside the block without the
+    delimiter (bad, counted as newlines before the line's start). Only the
+    edge lines are copied out of the block.
+    """
+    end = len(block) if end is None else end
+    newlines = count_newlines(block, start, end)
+    if not newlines:
+        return {'newlines': 0, 'head': bytes(block[start:end]), 'tail': b'', 'last': None, 'bad': None}
+    first = block.find(b'\n', start, end)
+    last_nl = block.rfind(b'\n', start, end)
+    last = None
+    if newlines > 1:
+        last = bytes(block[block.rfind(b'\n', start, last_nl) + 1:last_nl + 1])
+    bad = None
+    if pattern is not None and newlines > 1:
+        match = pattern.search(block, first + 1, last_nl + 1)
+        if match:
+            bad = count_newlines(block, start, match.start())
+    return {
+        'newlines': newlines,
+        'head': bytes(block[start:first + 1]),
+        'tail': bytes(block[last_nl + 1:end]),
+        'last': last,
+        'bad': bad,
+    }
+
+
+def merge_segments(a, b, delim=None, totals=None):
+    """Merge two adjacent segment summaries; delim (bytes) enables the delimiter check.
+
+    Segments made by a control_totals.ColumnTotals also carry column totals
+    and field counts, which need the same totals to merge.
+    """
+    if a is None:
+        return b
+    if not a['newlines']:
+        merged = dict(b)
+        merged['head'] = a['head'] + b['head']
+        return merged
+    if not b['newlines']:
+        merged = dict(a)
+        merged['tail'] = a['tail'] + b['head']
+        return merged
+    # The line straddling the boundary: a's tail plus b's head
+    joined = a['tail'] + b['head']
+    bad = a['bad']
+    if bad is None and delim is not None:
+        if delim not in joined:
+            bad = a['newlines']
+        elif b['bad'] is not None:
+            bad = a['newlines'] + b['bad']
+    merged = {
+        'newlines': a['newlines'] + b['newlines'],
+        'head': a['head'],
+        'tail': b['tail'],
+        'last': b['last'] if b['last'] is not None else joined,
+        'bad': bad,
+    }
+    if totals is not None:
+        totals.merge(merged, a, b, joined)
+    return merged
+
+
+def scan_segment(blocks, delimiter=None, totals=None):
+    """Fold a stream of blocks into a single segment summary.
+
+    With totals (a control_totals.ColumnTotals) each block is also totalled,
+    and the delimiter check uses the parser's delimiter counts instead of
+    a regex search.
+    """
+    pattern = missing_delimiter_pattern(delimiter) if delimiter and totals is None else None
+    delim = delimiter.encode() if delimiter else None
+    segment = None
+    for block in blocks:
+        if totals is not None:
+            current = totals.segment(block, delim is not None)
+        else:
+            current = block_segment(block, pattern)
+        segment = merge_segments(segment, current, delim, totals)
+        if delim is not None and segment['bad'] is not None:
+            # Past the first violation only counts and edges are needed
+            pattern = None
+            delim = None
+    return segment
+
+
+def segment_last_line(segment):
+    """Return the final line of a segment that starts at the beginning of a line."""
+    if segment['tail'] or not segment['newlines']:
+        return segment['tail'] or segment['head']
+    return segment['last'] if segment['last'] is not None else segment['head']
+
+
+def segment_bad_line(segment, delimiter):
+    """Return the 1-based number of the first line without the delimiter in a whole-file segment."""
+    delim = delimiter.encode()
+    if delim not in segment['head']:
+        return 1
+    if segment['bad'] is not None:
+        return segment['bad'] + 1
+    if segment['newlines'] and segment['tail'] and delim not in segment['tail']:
+        return segment['newlines'] + 1
+    return None
+
+
+def finish_segment(segment, delimiter, check_delimiter=True, totals=None):
+    """Turn the segment summary of a whole file into the scan result, with totals' results if given."""
+    if segment is None or not segment['head']:
+        raise ValueError("File is empty.")
+    newlines = segment['newlines']
+    head = segment['head']
+    tail = segment['tail']
+    line_count = newlines + 1 if tail or not newlines else newlines
+    last_line = segment_last_line(segment)
+
+    bad_line = segment_bad_line(segment, delimiter) if check_delimiter else None
+
+    header_line = head.decode('utf-8')
+    result = {
+        'delimiter': delimiter,
+        'header': parse_header(header_line, delimiter),
+        'line_count': line_count,
+        'last_line': last_line.decode('utf-8'),
+        'bad_line': bad_line,
+    }
+    if totals is not None:
+        result.update(totals.finish(segment))
+    return result
+
+
+def split_header(blocks):
+    """Read blocks until the header line is complete; return (header_line, first_data, rest)."""
+    blocks = iter(blocks)
+    first_blocks = []
+    for block in blocks:
+        # Copied, since read_blocks reuses its buffer for the next block
+        first_blocks.append(bytes(block))
+        if b'\n' in block:
+            break
+    data = b''.join(first_blocks)
+    if not data:
+        raise ValueError("File is empty.")
+    header_line = data.split(b'\n', 1)[0].decode('utf-8')
+    return header_line, data, blocks
+
+
+def scan_blocks(blocks, check_delimiter=True, totals=None):
+    """Scan a stream of blocks: detect the delimiter from the header, then fold the rest."""
+    header_line, first, rest = split_header(blocks)
+    delimiter = delimiter_from_line(header_line)
+
+    def stream():
+        yield first
+        yield from rest
+
+    segment = scan_segment(stream(), delimiter if check_delimiter else None, totals)
+    return finish_segment(segment, delimiter, check_delimiter, totals)
+
+
+def mapped_segment(mm, delimiter=None, start=0, end=None, totals=None):
+    """Summarise the byte range [start, end) of a mapping; delimiter enables the delimiter check.
+
+    Without totals the range is summarised in place. With totals it is
+    copied out a block at a time for the parser, so no export of the
+    mapping outlives an error.
+    """
+    end = len(mm) if end is None else end
+    if totals is None:
+        pattern = missing_delimiter_pattern(delimiter) if delimiter else None
+        return block_segment(mm, pattern, start, end)
+    blocks = (mm[pos:min(pos + BLOCK_SIZE, end)] for pos in range(start, end, BLOCK_SIZE))
+    return scan_segment(blocks, delimiter, totals)
+
+
+def scan_mapped(file_path, check_delimiter=True, totals=None):
+    """Scan a plain file through mmap.
+
+    Newline counting, the regex search for a line without the delimiter
+    and the trailer lookup all run over the mapped pages, so repeated
+    validations are served from the page cache without copying the file
+    into Python objects.
+    """
+    with map_file(file_path) as mm:
+        if mm is None:
+            raise ValueError("File is empty.")
+        first = mm.find(b'\n')
+        header_line = mm[:first if first != -1 else len(mm)].decode('utf-8')
+        delimiter = delimiter_from_line(header_line)
+        segment = mapped_segment(mm, delimiter if check_delimiter else None, totals=totals)
+    return finish_segment(segment, delimiter, check_delimiter, totals)
+
+
+def record_ranges(mm, parts):
+    """Split a mapping into up to parts byte ranges, each starting at the beginning of a line."""
+    size = len(mm)
+    step = max(size // parts, 1)
+    bounds = [0]
+    for i in range(1, parts):
+        newline = mm.find(b'\n', max(i * step, bounds[-1]))
+        if newline == -1 or newline + 1 >= size:
+            break
+        bounds.append(newline + 1)
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def scan_mapped_range(file_path, start, end, delimiter, totals=None):
+    """Summarise one byte range of a plain file in a worker process."""
+    with map_file(file_path) as mm:
+        return mapped_segment(mm, delimiter, start, end, totals)
+
+
+def scan_mapped_parallel(file_path, check_delimiter=True, workers=None, totals=None):
+    """Scan a large plain file by splitting it into record-aligned ranges across worker processes.
+
+    Each worker counts lines and finds its first delimiter violation in its
+    own range; the range summaries are merged in file order so line counts
+    and first-violation line numbers come out as in a sequential scan.
+    With totals, each worker also totals its range.
+    """
+    workers = workers or os.cpu_count() or 1
+    with map_file(file_path) as mm:
+        if mm is None:
+            raise ValueError("File is empty.")
+        first = mm.find(b'\n')
+        header_line = mm[:first if first != -1 else len(mm)].decode('utf-8')
+        ranges = record_ranges(mm, workers)
+    delimiter = delimiter_from_line(header_line)
+    check = delimiter if check_delimiter else None
+    delim = check.encode() if check else None
+    segment = None
+    with ProcessPoolExecutor(max_workers=min(workers, len(ranges))) as pool:
+        futures = [pool.submit(scan_mapped_range, file_path, start, end, check, totals) for start, end in ranges]
+        for future in futures:
+            segment = merge_segments(segment, future.result(), delim, totals)
+    return finish_segment(segment, delimiter, check_delimiter, totals)
+
+
+def scan_file(file_path, compression, check_delimiter=True, gzip_index=False, workers=1, progress=None,
+              totals=None):
+    """Read the file once and collect delimiter, header, line count, last line and first bad line.
+
+    line_count matches sum(1 for _ in f) over the text file, so callers
+    subtract 1 or 2 from it for the trailer/header.
+    bad_line is the 1-based number of the first line without the delimiter,
+    or None when every line has it (or check_delimiter is False).
+
+    For gzip files, gzip_index=True reuses (or builds during this pass) the
+    gzip_index sidecar so member ranges can be scanned in parallel; without
+    it, the members of a multi-member gzip file are found and inflated
+    across worker processes when workers > 1. Plain files of at least
+    PARALLEL_MIN_BYTES are split across worker processes when workers > 1.
+    A progress.Progress passed as progress is fed the bytes read by
+    streamed scans. totals (a control_totals.ColumnTotals) adds its column
+    totals and field counts to the result on every one of these paths.
+    """
+    if compression == 'gzip' and gzip_index:
+        import gzip_index as gzidx
+        return gzidx.scan_with_index(file_path, check_delimiter, totals=totals)
+    if compression == 'gzip' and workers > 1 and stat.S_ISREG(os.stat(file_path).st_mode):
+        import gzip_index as gzidx
+        if os.path.getsize(file_path) >= gzidx.PARALLEL_MIN_BYTES:
+            scan = gzidx.scan_members_parallel(file_path, check_delimiter, workers, totals=totals)
+            if scan is not None:
+                return scan
+    if is_mappable(file_path, compression):
+        if workers > 1 and os.path.getsize(file_path) >= PARALLEL_MIN_BYTES:
+            return scan_mapped_parallel(file_path, check_delimiter, workers, totals)
+        return scan_mapped(file_path, check_delimiter, totals)
+    with open_binary(file_path, compression) as f:
+        return scan_blocks(read_blocks(f, progress=progress), check_delimiter, totals)
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Random-access checkpoint index for gzip feeds.
+
+The index is a JSON sidecar (<file>.gzidx) holding checkpoints, as
+(compressed offset, decompressed offset) pairs, every span bytes of
+decompressed output. It is built during the first validation of a file and
+reused while the file's size and mtime are unchanged. Trailer reads can then
+start inflating near the end of the file, and the ranges between
+checkpoints can be scanned by separate worker processes.
+
+Python's zlib cannot resume inflating at an arbitrary bit offset inside a
+deflate stream (there is no inflatePrime), so checkpoints sit on gzip
+member boundaries, where a fresh decompressor can start with no window.
+Producers that flush by writing a new member get a fine-grained index.
+A single-member file gets just the one checkpoint at offset 0 and no
+sidecar is written for it.
+"""
+
+import json
+import os
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+
+from compression_codecs import gzip_decompressobj
+from fused_engine import (delimiter_from_line, finish_segment, map_file, merge_segments,
+                          scan_blocks, scan_segment, segment_last_line)
+
+INDEX_SUFFIX = '.gzidx'
+DEFAULT_SPAN = 32 * 1024 * 1024  # Decompressed bytes between checkpoints
+READ_SIZE = 1024 * 1024
+OUT_SIZE = 8 * 1024 * 1024
+MEMBER_MAGIC = b'\x1f\x8b\x08'  # gzip ID bytes and the deflate method
+RESERVED_FLAGS = 0xe0  # Header flag bits that must be zero; zlib rejects members that set them
+PARALLEL_MIN_BYTES = 8 * 1024 * 1024  # Smaller compressed files are inflated in one pass
+RANGES_PER_WORKER = 4  # Member ranges per worker, so uneven members still balance
+
+
+def inflate_blocks(f, start=0, end=None, on_member=None, on_end=None):
+    """Yield decompressed blocks of a gzip stream from compressed offset start.
+
+    Concatenated members are followed transparently. Decompression stops at
+    EOF, or before the first member that starts at or after end.
+    on_member(compressed_offset, decompressed_offset) is called at the start
+    of every member, and on_end with the same pair where decompression
+    stopped, with decompressed_offset relative to start.
+    """
+    f.seek(start)
+    position = start  # Compressed offset of the first byte in buf
+    out = 0
+    buf = b''
+    inflater = None
+    while True:
+        if not buf:
+            buf = f.read(READ_SIZE)
+            if not buf:
+                break
+        if inflater is None:
+            # gzip allows zero padding after a member
+            stripped = buf.lstrip(b'\x00')
+            position += len(buf) - len(stripped)
+            buf = stripped
+            if not buf:
+                continue
+            if end is not None and position >= end:
+                break
+            if on_member is not None:
+                on_member(position, out)
+            inflater = gzip_decompressobj()
+        data = inflater.decompress(buf, OUT_SIZE)
+        if inflater.eof:
+            position += len(buf) - len(inflater.unused_data)
+            buf = inflater.unused_data
+            inflater = None
+        else:
+            position += len(buf) - len(inflater.unconsumed_tail)
+            buf = inflater.unconsumed_tail
+        if data:
+            out += len(data)
+            yield data
+    if inflater is not None:
+        data = inflater.flush()
+        if data:
+            yield data
+        raise EOFError("Compressed file ended before the end-of-stream marker was reached")
+    if on_end is not None:
+        on_end(position, out)
+
+
+def index_path(file_path):
+    """Return the sidecar path for a gzip file."""
+    return file_path + INDEX_SUFFIX
+
+
+def file_identity(file_path):
+    """Return the (size, mtime_ns) pair an index is valid for."""
+    st = os.stat(file_path)
+    return st.st_size, st.st_mtime_ns
+
+
+def load_index(file_path):
+    """Load the sidecar index if it exists and still matches the file, else None."""
+    try:
+        with open(index_path(file_path), 'r') as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    size, mtime_ns = file_identity(file_path)
+    if index.get('size') != size or index.get('mtime_ns') != mtime_ns:
+        return None
+    return index
+
+
+def save_index(file_path, checkpoints, span):
+    """Write the sidecar index for a gzip file."""
+    size, mtime_ns = file_identity(file_path)
+    index = {'size': size, 'mtime_ns': mtime_ns, 'span': span, 'checkpoints': checkpoints}
+    with open(index_path(file_path), 'w') as f:
+        json.dump(index, f)
+    return index
+
+
+def checkpoint_recorder(span):
+    """Return (checkpoints, on_member) that keeps member starts at least span bytes apart."""
+    checkpoints = []
+
+    def on_member(compressed_offset, decompressed_offset):
+        if not checkpoints or decompressed_offset - checkpoints[-1][1] >= span:
+            checkpoints.append([compressed_offset, decompressed_offset])
+
+    return checkpoints, on_member
+
+
+def build_index(file_path, span=DEFAULT_SPAN):
+    """Inflate the whole file once and write its sidecar index."""
+    checkpoints, on_member = checkpoint_recorder(span)
+    with open(file_path, 'rb') as f:
+        for _ in inflate_blocks(f, on_member=on_member):
+            pass
+    return save_index(file_path, checkpoints, span)
+
+
+def index_ranges(file_path, index):
+    """Return (start, end) compressed ranges between consecutive checkpoints."""
+    starts = [checkpoint[0] for checkpoint in index['checkpoints']]
+    ends = starts[1:] + [os.path.getsize(file_path)]
+    return list(zip(starts, ends))
+
+
+def scan_range(file_path, start, end, delimiter, totals=None):
+    """Scan one compressed range in a worker and return its segment summary (see fused_engine.scan_segment)."""
+    with open(file_path, 'rb') as f:
+        return scan_segment(inflate_blocks(f, start, end), delimiter, totals)
+
+
+def member_candidates(file_path):
+    """Return the offsets of every possible gzip member header in the file, in order.
+
+    A candidate is the gzip ID bytes and deflate method followed by a flag
+    byte with no reserved bits set. Deflate data can hold the same bytes,
+    so a candidate is only known to start a member once it inflates.
+    """
+    offsets = []
+    with map_file(file_path) as mm:
+        if mm is None:
+            return offsets
+        position = mm.find(MEMBER_MAGIC)
+        while position != -1:
+            if position + 3 < len(mm) and not mm[position + 3] & RESERVED_FLAGS:
+                offsets.append(position)
+            position = mm.find(MEMBER_MAGIC, position + 1)
+    return offsets
+
+
+def split_candidates(candidates, size, parts):
+    """Pick up to parts range starts among the candidates, spread evenly over the compressed size."""
+    starts = [0]
+    for i in range(1, parts):
+        j = bisect_right(candidates, max(i * size // parts, starts[-1]))
+        if j == len(candidates):
+            break
+        starts.append(candidates[j])
+    return starts
+
+
+def inflate_range(file_path, start, end, delimiter, totals=None):
+    """Scan the members that start in the compressed range [start, end).
+
+    Returns the segment summary, the members seen as (compressed offset,
+    decompressed offset) pairs relative to start, and the pair where
+    decompression stopped. The last member is followed past end to its
+    own end, so the stop offset is the next member boundary.
+    """
+    members = []
+    stop = []
+    with open(file_path, 'rb') as f:
+        blocks = inflate_blocks(f, start, end, on_member=lambda *member: members.append(member),
+                                on_end=lambda *offsets: stop.extend(offsets))
+        segment = scan_segment(blocks, delimiter, totals)
+    return {'segment': segment, 'members': members, 'stop': stop[0], 'inflated': stop[1]}
+
+
+def probe_range(file_path, start, end, delimiter, totals=None):
+    """inflate_range in a worker; None when start turns out not to be a member boundary."""
+    try:
+        return inflate_range(file_path, start, end, delimiter, totals)
+    except Exception:
+        # Usually a false candidate; real damage is raised again when the parent re-inflates it
+        return None
+
+
+def scan_members_parallel(file_path, check_delimiter=True, workers=None, on_member=None, totals=None):
+    """Scan a multi-member gzip file by inflating its members in parallel worker processes.
+
+    Candidate member starts are found in the compressed bytes, and each
+    worker inflates the members of one range between candidates. The
+    ranges are then chained in file order from offset 0. Each range
+    continues at the offset where the previous one stopped, so ranges
+    that began at a false candidate are never used. A gap in the chain,
+    where a range began at a false candidate or failed, is inflated in
+    this process, which raises any real decompression error.
+    on_member is called for every member as in inflate_blocks, and totals
+    is passed on to the range scans as in fused_engine.scan_file.
+
+    Returns None when the file has no second member to split at.
+    """
+    workers = workers or os.cpu_count() or 1
+    size = os.path.getsize(file_path)
+    starts = split_candidates(member_candidates(file_path), size, workers * RANGES_PER_WORKER)
+    if len(starts) < 2:
+        return None
+    delimiter = delimiter_from_line(read_header_line(file_path))
+    check = delimiter if check_delimiter else None
+    delim = check.encode() if check else None
+    ends = starts[1:] + [size]
+    segment = None
+    position = 0
+    inflated = 0
+    with ProcessPoolExecutor(max_workers=min(workers, len(starts))) as pool:
+        futures = {start: pool.submit(probe_range, file_path, start, end, check, totals)
+                   for start, end in zip(starts, ends)}
+        while position < size:
+            future = futures.get(position)
+            result = future.result() if future is not None else None
+            if result is None:
+                later = bisect_right(starts, position)
+                result = inflate_range(file_path, position, starts[later] if later < len(starts) else size, check,
+                                       totals)
+            if result['segment'] is not None:
+                segment = merge_segments(segment, result['segment'], delim, totals)
+            if on_member is not None:
+                for compressed_offset, decompressed_offset in result['members']:
+                    on_member(compressed_offset, inflated + decompressed_offset)
+            inflated += result['inflated']
+            position = result['stop']
+        for future in futures.values():
+            future.cancel()
+    return finish_segment(segment, delimiter, check_delimiter, totals)
+
+
+def read_header_line(file_path):
+    """Inflate just enough of the file to return its first line."""
+    with open(file_path, 'rb') as f:
+        data = b''
+        for block in inflate_blocks(f):
+            data += block
+            if b'\n' in data:
+                break
+    if not data:
+        raise ValueError("File is empty.")
+    return data.split(b'\n', 1)[0].decode('utf-8')
+
+
+def scan_with_index(file_path, check_delimiter=True, span=DEFAULT_SPAN, workers=None, totals=None):
+    """Scan a gzip file, using or building its sidecar index.
+
+    With a usable index the member ranges are scanned in parallel and their
+    segment summaries merged. Otherwise the members are found and scanned
+    by scan_members_parallel (or sequentially, for a small or
+    single-member file) and the index is written for the next run.
+    totals is passed on to the range scans as in fused_engine.scan_file.
+    """
+    index = load_index(file_path)
+    if index is None or len(index['checkpoints']) < 2:
+        checkpoints, on_member = checkpoint_recorder(span)
+        result = None
+        if workers != 1 and os.path.getsize(file_path) >= PARALLEL_MIN_BYTES:
+            result = scan_members_parallel(file_path, check_delimiter, workers, on_member, totals)
+        if result is None:
+            with open(file_path, 'rb') as f:
+                result = scan_blocks(inflate_blocks(f, on_member=on_member), check_delimiter, totals)
+        if len(checkpoints) > 1:
+            save_index(file_path, checkpoints, span)
+        return result
+
+    delimiter = delimiter_from_line(read_header_line(file_path))
+    check = delimiter if check_delimiter else None
+    ranges = index_ranges(file_path, index)
+    workers = min(workers or os.cpu_count() or 1, len(ranges))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(scan_range, file_path, start, end, check, totals) for start, end in ranges]
+        segment = None
+        delim = check.encode() if check else None
+        for future in futures:
+            result = future.result()
+            # A range that inflates nothing, such as an empty trailing member, has no segment
+            if result is not None:
+                segment = merge_segments(segment, result, delim, totals)
+    return finish_segment(segment, delimiter, check_delimiter, totals)
+
+
+def last_line_from(file_path, starts, skip_failures=False):
+    """Return the last line of a gzip file, inflating from the latest of starts (member offsets) that holds it.
+
+    With skip_failures, a start that does not inflate is passed over as a
+    false member candidate; offset 0 always raises.
+    """
+    with open(file_path, 'rb') as f:
+        for start in reversed(starts):
+            try:
+                segment = scan_segment(inflate_blocks(f, start))
+            except Exception:
+                if not skip_failures or start == 0:
+                    raise
+                continue
+            if segment is None:
+                continue
+            # Past the first checkpoint the last line is only complete when a
+            # newline inside the inflated tail precedes it.
+            complete = segment['newlines'] > 1 or (segment['newlines'] and segment['tail'])
+            if start == 0 or complete:
+                return segment_last_line(segment)
+    return None
+
+
+def index_last_line(file_path, index):
+    """Return the last line of an indexed gzip file, inflating only from the last checkpoints."""
+    return last_line_from(file_path, [checkpoint[0] for checkpoint in index['checkpoints']])
+
+
+def member_last_line(file_path):
+    """Return the last line of a gzip file without an index, inflating only its last members."""
+    starts = [0] + [offset for offset in member_candidates(file_path) if offset]
+    return last_line_from(file_path, starts, skip_failures=True)
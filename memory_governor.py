@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Adaptive chunk sizing for the pandas validators.
+
+get_dynamic_chunk_size assumed 500 bytes per row and sized one chunk to
+all available memory minus a fixed reserve. On a large box that was
+hundreds of millions of rows per chunk, and two validations running at
+once would each claim the same memory. Here one global budget (available
+memory minus RESERVED_MEMORY, or MEMORY_BUDGET) is divided across the
+validations that run concurrently. Each validation is also capped at
+WORKER_MEMORY_BUDGET.
+
+A MemoryGovernor starts with a small first chunk and measures its real
+DataFrame size per row. It then sizes the following chunks to the budget.
+After every chunk it checks the process RSS. If the RSS has grown past the
+budget, the per-row estimate is raised to that growth divided by the rows
+of the chunk, so later chunks get smaller. The estimate never goes back
+down.
+"""
+
+MB = 1024 * 1024
+
+# Total bytes shared by all concurrent validations; None uses available memory minus RESERVED_MEMORY
+MEMORY_BUDGET = None
+RESERVED_MEMORY = 1024 * MB
+# Upper bound for a single validation, however large the global budget
+WORKER_MEMORY_BUDGET = 1024 * MB
+MIN_MEMORY_BUDGET = 64 * MB
+
+FIRST_CHUNK_ROWS = 10_000
+MIN_CHUNK_ROWS = 1_000
+MAX_CHUNK_ROWS = 5_000_000
+# Peak parser memory relative to the finished DataFrame (raw text, token buffers, the frame itself)
+PARSE_OVERHEAD = 3
+
+# Number of validations sharing MEMORY_BUDGET; set in each pool worker by share_memory_budget
+CONCURRENCY = 1
+
+
+def total_memory_budget():
+    """Return the global budget in bytes."""
+    if MEMORY_BUDGET:
+        return MEMORY_BUDGET
+    import psutil
+    return max(psutil.virtual_memory().available - RESERVED_MEMORY, MIN_MEMORY_BUDGET)
+
+
+def share_memory_budget(concurrency, total=None):
+    """Make this process one of `concurrency` validations sharing `total` bytes (a pool initializer).
+
+    The parent measures the total once and passes it in, so the workers
+    do not each see a different amount of memory as the others start.
+    """
+    global CONCURRENCY, MEMORY_BUDGET
+    CONCURRENCY = max(concurrency, 1)
+    if total:
+        MEMORY_BUDGET = total
+
+
+def worker_budget():
+    """Return the budget in bytes for one validation in this process."""
+    share = total_memory_budget() // CONCURRENCY
+    return max(min(WORKER_MEMORY_BUDGET, share), MIN_MEMORY_BUDGET)
+
+
+class MemoryGovernor:
+    """Chunk sizes for one pandas read, kept within a memory budget."""
+
+    def __init__(self, budget=None):
+        import psutil
+
+        self.budget = budget or worker_budget()
+        self.process = psutil.Process()
+        self.baseline = self.process.memory_info().rss
+        self.bytes_per_row = None
+        self.peak_used = 0
+        self.chunk_size = FIRST_CHUNK_ROWS
+
+    def observe(self, chunk):
+        """Update the per-row estimate from a finished chunk and resize the next one."""
+        rows = len(chunk)
+        if not rows:
+            return
+        if self.bytes_per_row is None:
+            self.bytes_per_row = chunk.memory_usage(deep=True).sum() / rows * PARSE_OVERHEAD
+        used = self.process.memory_info().rss - self.baseline
+        self.peak_used = max(self.peak_used, used)
+        if used > self.budget:
+            # The estimate was too low for this data: charge each row its share of the RSS growth
+            self.bytes_per_row = max(self.bytes_per_row, used / rows)
+        rows_in_budget = int(self.budget / max(self.bytes_per_row, 1))
+        self.chunk_size = min(max(rows_in_budget, MIN_CHUNK_ROWS), MAX_CHUNK_ROWS)
+
+    def chunks(self, reader):
+        """Yield DataFrames from a pandas TextFileReader, each sized by the current estimate."""
+        with reader:
+            while True:
+                try:
+                    chunk = reader.get_chunk(self.chunk_size)
+                except StopIteration:
+                    return
+                yield chunk
+                self.observe(chunk)
+
+    def describe(self):
+        return (f"memory budget {self.budget / MB:,.0f} MB, "
+                f"{self.bytes_per_row or 0:,.0f} bytes/row, next chunk {self.chunk_size:,} rows")
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Process-pool directory scanning shared by the validators.
+
+Paths are streamed from the directory walk into a pool of worker processes
+and (path, valid, elapsed) results come back in completion order. Only a
+bounded number of files is in flight at once, so a huge walk never queues
+every path up front. Each worker gets an equal share of the global memory
+budget (see memory_governor.py).
+
+The walk itself is a generator over os.scandir. Include/exclude globs,
+extensions and size bounds are applied to each DirEntry before the file
+is opened, and the cached stat is kept for the ledger.
+"""
+
+import fnmatch
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from memory_governor import share_memory_budget, total_memory_budget
+
+# Skipped by default: gzip index sidecars are not feeds
+EXCLUDE_PATTERNS = ('*.gzidx',)
+
+
+def compile_globs(patterns):
+    """Compile fnmatch globs into one case-sensitive regex, or None when there are none."""
+    if not patterns:
+        return None
+    return re.compile('|'.join(fnmatch.translate(pattern) for pattern in patterns))
+
+
+class FileFilter:
+    """Which files a directory walk yields, decided before any file is opened.
+
+    include and exclude are fnmatch globs tried against both the file name
+    and its path relative to the walked directory. A file must match one
+    include glob (when there are any) and no exclude glob. extensions are
+    name suffixes such as '.psv' or '.psv.gz', compared case-insensitively.
+    The size bounds are inclusive byte counts. They are checked against the
+    DirEntry's stat, which the walk caches, so the ledger reuses it.
+    """
+
+    def __init__(self, include=None, exclude=EXCLUDE_PATTERNS, extensions=None, min_size=None, max_size=None):
+        self.include = compile_globs(include)
+        self.exclude = compile_globs(exclude)
+        self.extensions = tuple(extension.lower() for extension in extensions or ())
+        self.min_size = min_size
+        self.max_size = max_size
+
+    def matches(self, entry, relative_path):
+        if self.include and not (self.include.match(entry.name) or self.include.match(relative_path)):
+            return False
+        if self.exclude and (self.exclude.match(entry.name) or self.exclude.match(relative_path)):
+            return False
+        if self.extensions and not entry.name.lower().endswith(self.extensions):
+            return False
+        if self.min_size is not None or self.max_size is not None:
+            size = entry.stat().st_size
+            if self.min_size is not None and size < self.min_size:
+                return False
+            if self.max_size is not None and size > self.max_size:
+                return False
+        return True
+
+
+def walk_entries(directory_path, file_filter=None):
+    """Yield an os.DirEntry for every file under the directory that passes file_filter.
+
+    Each directory is read with os.scandir and its files are yielded as
+    they are listed, before its subdirectories are walked (top-down, like
+    os.walk). Nothing is collected first, so the first file comes out at
+    once even in a directory of millions, and memory stays flat.
+    Symlinked directories are not followed and unreadable directories are
+    skipped, as with os.walk. entry.stat() is cached by the DirEntry.
+    """
+    file_filter = file_filter or FileFilter()
+    root_length = len(os.path.join(directory_path, ''))
+    pending = [directory_path]
+    while pending:
+        current = pending.pop()
+        subdirectories = []
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir():
+                            if not entry.is_symlink():
+                                subdirectories.append(entry.path)
+                            continue
+                        if not entry.is_file():
+                            continue
+                    except OSError:
+                        continue
+                    if file_filter.matches(entry, entry.path[root_length:]):
+                        yield entry
+        except OSError:
+            continue
+        pending.extend(reversed(subdirectories))
+
+
+def walk_files(directory_path, file_filter=None):
+    """Yield the path of every file under the directory that passes file_filter (see walk_entries)."""
+    for entry in walk_entries(directory_path, file_filter):
+        yield entry.path
+
+
+def timed_validate(validate, file_path):
+    """Run one validator call and return (path, valid, elapsed).
+
+    Validators return either a bool or a (valid, time_taken) tuple.
+    """
+    start_time = time.time()
+    result = validate(file_path)
+    valid = result[0] if isinstance(result, tuple) else bool(result)
+    return file_path, valid, time.time() - start_time
+
+
+def scan_parallel(paths, validate, workers=None):
+    """Validate paths across worker processes, yielding results as they finish.
+
+    validate must be a module-level function so it can be sent to the
+    workers. Results arrive in completion order; callers that write output
+    files go through scan_in_order to keep the output deterministic.
+    """
+    workers = workers or os.cpu_count() or 1
+    max_pending = workers * 4
+    # Measured once here so every worker divides the same total
+    with ProcessPoolExecutor(max_workers=workers, initializer=share_memory_budget,
+                             initargs=(workers, total_memory_budget())) as pool:
+        pending = set()
+        for file_path in paths:
+            pending.add(pool.submit(timed_validate, validate, file_path))
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+def scan_in_order(scan, paths, validate, workers=None):
+    """Run scan (scan_parallel or prefetch_scan.scan_prefetched) but yield results in the order of paths.
+
+    Results still stream: each one is yielded as soon as every path before
+    it has finished. A result that finishes early waits in a reorder buffer
+    keyed by path, which only holds the few small tuples that overtook the
+    oldest file still being validated, so output files come out the same
+    whatever the worker count.
+    """
+    submitted = deque()
+    finished = {}
+
+    def tracked_paths():
+        for file_path in paths:
+            submitted.append(file_path)
+            yield file_path
+
+    def pop_oldest():
+        file_path = submitted.popleft()
+        results = finished[file_path]
+        result = results.popleft()
+        if not results:
+            del finished[file_path]
+        return result
+
+    for result in scan(tracked_paths(), validate, workers):
+        finished.setdefault(result[0], deque()).append(result)
+        while submitted and submitted[0] in finished:
+            yield pop_oldest()
+    while submitted:
+        if submitted[0] in finished:
+            yield pop_oldest()
+        else:
+            submitted.popleft()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pipelined directory scanning that overlaps file reads with validation.
+
+scan_parallel hands a path to a worker, which then waits on every read of
+that file before any CPU work starts. On NFS that latency is added to
+every file. Here the scan runs as three asyncio stages joined by bounded
+queues:
+
+    enumerate -> prefetch (I/O threads) -> validate (worker processes)
+
+The prefetch stage reads each upcoming file through the OS page cache.
+It reads the head and tail blocks first, because those are what the
+cheapest rules need, and then streams the body through one reused
+PREFETCH_BLOCK_SIZE buffer. When a worker opens the file, its reads are
+served from local memory, so network latency is hidden behind the
+validation of earlier files instead of being added to it.
+
+Only PREFETCH_FILES files and PREFETCH_BYTES bytes are read ahead at once,
+so prefetched pages are not evicted before they are used. Bodies larger
+than PREFETCH_BODY_BYTES are not read ahead, only their head and tail; the
+worker streams them itself with the kernel's normal readahead.
+"""
+
+import asyncio
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from memory_governor import share_memory_budget, total_memory_budget
+from parallel_scan import timed_validate
+
+PREFETCH_FILES = 8
+PREFETCH_BYTES = 1024 * 1024 * 1024
+PREFETCH_BODY_BYTES = 256 * 1024 * 1024
+PREFETCH_BLOCK_SIZE = 1024 * 1024
+IO_THREADS = 4
+
+
+def prefetch_file(file_path, block_size=PREFETCH_BLOCK_SIZE, body_limit=PREFETCH_BODY_BYTES):
+    """Read the file's head, tail and (up to body_limit) body into the page cache; return its size."""
+    size = os.path.getsize(file_path)
+    buf = bytearray(block_size)
+    with open(file_path, 'rb', buffering=0) as f:
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        f.readinto(buf)
+        if size > block_size:
+            f.seek(size - block_size)
+            f.readinto(buf)
+        if size <= body_limit:
+            f.seek(block_size)
+            while f.readinto(buf):
+                pass
+    return size
+
+
+class ByteBudget:
+    """Bytes read ahead but not yet validated; acquire waits while the budget is full."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_flight = 0
+        self.condition = asyncio.Condition()
+
+    async def acquire(self, size):
+        async with self.condition:
+            # A file larger than the whole budget still goes through on its own
+            await self.condition.wait_for(lambda: self.in_flight == 0 or self.in_flight + size <= self.limit)
+            self.in_flight += size
+
+    async def release(self, size):
+        async with self.condition:
+            self.in_flight -= size
+            self.condition.notify_all()
+
+
+async def run_pipeline(path_source, validate, workers, on_result, prefetch_files=PREFETCH_FILES,
+                       prefetch_bytes=PREFETCH_BYTES):
+    """Run the prefetch and validate stages over the paths put on path_source until it yields None.
+
+    path_source is a queue.Queue filled by the enumeration stage; on_result
+    gets each (path, valid, elapsed).
+    """
+    loop = asyncio.get_running_loop()
+    path_queue = asyncio.Queue(maxsize=prefetch_files)
+    ready_queue = asyncio.Queue(maxsize=prefetch_files)
+    budget = ByteBudget(prefetch_bytes)
+    io_threads = min(IO_THREADS, prefetch_files)
+    stopping = threading.Event()
+
+    def next_path():
+        # Polls, so the I/O thread can exit if a later stage fails
+        while not stopping.is_set():
+            try:
+                return path_source.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return None
+
+    async def enumerate_paths(io_pool):
+        while (file_path := await loop.run_in_executor(io_pool, next_path)) is not None:
+            await path_queue.put(file_path)
+        for _ in range(io_threads):
+            await path_queue.put(None)
+
+    async def prefetch(io_pool):
+        while (file_path := await path_queue.get()) is not None:
+            try:
+                size = min(os.path.getsize(file_path), PREFETCH_BODY_BYTES)
+            except OSError:
+                size = 0
+            await budget.acquire(size)
+            try:
+                await loop.run_in_executor(io_pool, prefetch_file, file_path)
+            except OSError:
+                # The worker reports unreadable files; prefetching is only a hint
+                pass
+            await ready_queue.put((file_path, size))
+
+    async def read_ahead(io_pool):
+        await asyncio.gather(enumerate_paths(io_pool), *(prefetch(io_pool) for _ in range(io_threads)))
+        for _ in range(workers):
+            await ready_queue.put(None)
+
+    async def validate_ready(cpu_pool):
+        while (item := await ready_queue.get()) is not None:
+            file_path, size = item
+            try:
+                on_result(await loop.run_in_executor(cpu_pool, timed_validate, validate, file_path))
+            finally:
+                await budget.release(size)
+
+    with ThreadPoolExecutor(max_workers=io_threads + 1) as io_pool, \
+            ProcessPoolExecutor(max_workers=workers, initializer=share_memory_budget,
+                                initargs=(workers, total_memory_budget())) as cpu_pool:
+        try:
+            # A failure in any stage ends the whole gather, so none is left waiting on a queue
+            await asyncio.gather(read_ahead(io_pool), *(validate_ready(cpu_pool) for _ in range(workers)))
+        finally:
+            stopping.set()
+
+
+def scan_prefetched(paths, validate, workers=None, prefetch_files=PREFETCH_FILES, prefetch_bytes=PREFETCH_BYTES):
+    """Validate paths like scan_parallel, reading the next files ahead while the current ones are validated.
+
+    Results are yielded in completion order as (path, valid, elapsed).
+    The pipeline runs its event loop on a background thread. The paths
+    iterator is consumed here on the calling thread, so iterators tied to
+    it (such as the ledger filter's SQLite connection) keep working.
+    """
+    workers = workers or os.cpu_count() or 1
+    path_queue = queue.Queue(maxsize=prefetch_files)
+    # Unbounded: results are small, and a full queue would stall the event loop
+    results = queue.Queue()
+    done = object()
+    failure = []
+
+    def run():
+        try:
+            asyncio.run(run_pipeline(path_queue, validate, workers, results.put, prefetch_files,
+                                     prefetch_bytes))
+        except BaseException as e:
+            failure.append(e)
+        finally:
+            results.put(done)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    stopped = False
+
+    def ready_results():
+        """Yield the results that are already in, noting when the pipeline has stopped."""
+        nonlocal stopped
+        while not stopped and not results.empty():
+            result = results.get()
+            if result is done:
+                stopped = True
+            else:
+                yield result
+
+    def hand_over(item):
+        """Put item on the path queue, yielding results while the queue is full."""
+        while not stopped:
+            try:
+                path_queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                yield from ready_results()
+
+    for file_path in paths:
+        yield from hand_over(file_path)
+        yield from ready_results()
+        if stopped:
+            break
+    yield from hand_over(None)
+    if not stopped:
+        while (result := results.get()) is not done:
+            yield result
+    thread.join()
+    if failure:
+        raise failure[0]
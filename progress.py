@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Console output for the validators.
+
+log() prints the usual banner and message unless quiet mode is on; warn()
+always prints, so errors still show up in batch runs. Progress reports
+rows/s and MB/s for a long loop from a background thread at most every
+REPORT_INTERVAL seconds. The loop itself only bumps the rows and bytes
+counters, so hot loops do no formatting or console I/O of their own.
+"""
+
+import threading
+import time
+
+QUIET = False
+REPORT_INTERVAL = 5.0
+
+
+def set_quiet(quiet=True):
+    """Silence log() and progress reports (warn() still prints)."""
+    global QUIET
+    QUIET = quiet
+
+
+def log(message):
+    """Print an informational message with the usual separator, unless quiet."""
+    if not QUIET:
+        print("="*60)
+        print(message)
+
+
+def warn(message):
+    """Print an error or rejection message, even when quiet."""
+    print("="*60)
+    print(message)
+
+
+class Progress:
+    """Rate-limited progress for one loop; update .rows and .bytes inside it."""
+
+    def __init__(self, label, interval=None):
+        self.label = label
+        self.interval = interval or REPORT_INTERVAL
+        self.rows = 0
+        self.bytes = 0
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        if not QUIET:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+        return False
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.report()
+
+    def report(self):
+        elapsed = time.perf_counter() - self.start
+        parts = []
+        if self.rows:
+            parts.append(f"{self.rows:,} rows ({self.rows / elapsed:,.0f} rows/s)")
+        if self.bytes:
+            size_mb = self.bytes / (1024 * 1024)
+            parts.append(f"{size_mb:,.1f} MB ({size_mb / elapsed:.1f} MB/s)")
+        print(f"{self.label}: {', '.join(parts) or 'started'} after {elapsed:.0f} s", flush=True)
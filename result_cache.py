@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Validation result cache keyed by file content.
+
+Upstreams often redeliver byte-identical files under new names or in new
+dated folders. A fingerprint (size plus a hash of every byte) is combined with
+the validator settings into a key. A hit returns the earlier verdict
+without decompressing or parsing the file again. The sampled fingerprint
+only hashes the head, the tail and evenly spaced blocks, which is cheaper
+but cannot see a change between them; it is opt-in, for feeds that are
+never edited in place.
+
+Verdicts live in a local SQLite database holding at most max_entries rows;
+the least recently used entries are evicted first.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+CACHE_PATH = "validation_cache.db"
+MAX_ENTRIES = 100_000
+SAMPLE_SIZE = 64 * 1024
+SAMPLE_BLOCKS = 16
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def fingerprint(file_path, sampled=False):
+    """Return a content fingerprint for the file.
+
+    The default fingerprint hashes every byte; sampled=True reads only the
+    head, the tail and SAMPLE_BLOCKS evenly spaced blocks instead.
+    """
+    size = os.path.getsize(file_path)
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(str(size).encode())
+    with open(file_path, 'rb') as f:
+        if not sampled or size <= SAMPLE_SIZE * (SAMPLE_BLOCKS + 2):
+            while True:
+                block = f.read(HASH_BLOCK_SIZE)
+                if not block:
+                    break
+                digest.update(block)
+            kind = 'full'
+        else:
+            step = (size - SAMPLE_SIZE) // (SAMPLE_BLOCKS + 1)
+            offsets = [0] + [step * i for i in range(1, SAMPLE_BLOCKS + 1)] + [size - SAMPLE_SIZE]
+            for offset in offsets:
+                f.seek(offset)
+                digest.update(f.read(SAMPLE_SIZE))
+            kind = 'sampled'
+    return f"{kind}:{size}:{digest.hexdigest()}"
+
+
+def cache_key(file_fingerprint, context):
+    """Combine a fingerprint with the validator settings (schema, count mode) into a cache key."""
+    settings = json.dumps(context, sort_keys=True)
+    return hashlib.blake2b(f"{file_fingerprint}\n{settings}".encode(), digest_size=20).hexdigest()
+
+
+def open_cache(cache_path=CACHE_PATH):
+    """Open (creating if needed) the result cache database."""
+    conn = sqlite3.connect(cache_path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS results ("
+        " cache_key TEXT PRIMARY KEY,"
+        " verdict TEXT NOT NULL,"
+        " last_used REAL NOT NULL)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+    conn.commit()
+    return conn
+
+
+def lookup(conn, key):
+    """Return the cached verdict dict for key, or None, and mark the entry as recently used."""
+    row = conn.execute("SELECT verdict FROM results WHERE cache_key = ?", (key,)).fetchone()
+    if row is None:
+        return None
+    conn.execute("UPDATE results SET last_used = ? WHERE cache_key = ?", (time.time(), key))
+    conn.commit()
+    return json.loads(row[0])
+
+
+def store(conn, key, verdict, max_entries=MAX_ENTRIES):
+    """Store a verdict dict, evicting the least recently used entries beyond max_entries."""
+    conn.execute(
+        "INSERT OR REPLACE INTO results (cache_key, verdict, last_used) VALUES (?, ?, ?)",
+        (key, json.dumps(verdict), time.time()),
+    )
+    excess = conn.execute("SELECT COUNT(*) FROM results").fetchone()[0] - max_entries
+    if excess > 0:
+        conn.execute(
+            "DELETE FROM results WHERE cache_key IN"
+            " (SELECT cache_key FROM results ORDER BY last_used LIMIT ?)",
+            (excess,),
+        )
+    conn.commit()
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cost-ordered validation rules for the header/trailer validators.
+
+Each Rule pairs a check with a declared cost, i.e. how much of the file it
+has to read. run_rules runs the rules cheapest first and stops at the first
+failure. A file with the wrong header is rejected after its first line is
+read, and a wrong trailer on a plain file after a tail read, both before
+the full counting pass.
+
+Rules read what they need from a FileFacts. Its facts (header, trailer, full
+scan) are computed on first use and shared, so the row count and delimiter
+consistency rules still come from the same single scan. schema_rule routes
+the header to its schema and leaves the schema's columns on the facts for
+the rules after it. When control totals or field counts are configured
+the scan also totals their columns and counts every line's fields (see
+control_totals.py), still in one pass.
+"""
+
+import os
+from contextlib import nullcontext
+from decimal import Decimal, InvalidOperation
+from functools import cached_property
+
+from control_totals import TOTAL_DECIMALS, scan_with_totals
+from fused_engine import DelimiterError, delimiter_from_line, open_binary, parse_header, scan_file
+from progress import Progress, log
+from trailer_reader import read_last_line
+
+# Declared costs: first line only, a seek-from-EOF read, and every byte of the file
+COST_HEAD = 1
+COST_TAIL = 10
+COST_SCAN = 100
+
+
+class FileFacts:
+    """Lazily computed facts about one file, shared by the rules that check it."""
+
+    def __init__(self, file_path, compression, check_delimiter=True, gzip_index=False, workers=1,
+                 timer=None, total_columns=(), field_counts=False):
+        self.file_path = file_path
+        self.compression = compression
+        self.check_delimiter = check_delimiter
+        self.gzip_index = gzip_index
+        self.workers = workers
+        self.timer = timer
+        # Columns the scan totals for control_total_rule, and whether it counts fields for field_count_rule
+        self.total_columns = tuple(total_columns)
+        self.field_counts = field_counts
+        # Set by schema_rule once the header is routed to a schema
+        self.expected_columns = None
+
+    def stage(self, name, **kwargs):
+        if self.timer is None:
+            return nullcontext({})
+        return self.timer.stage(name, **kwargs)
+
+    @cached_property
+    def header_line(self):
+        with self.stage('header', rows=1), open_binary(self.file_path, self.compression) as f:
+            line = f.readline()
+        if not line:
+            raise DelimiterError("File is empty.")
+        return line.decode('utf-8').rstrip('\r\n')
+
+    @cached_property
+    def delimiter(self):
+        delimiter = delimiter_from_line(self.header_line)
+        log(f"Delimiter detected: {delimiter}")
+        return delimiter
+
+    @cached_property
+    def header(self):
+        columns = parse_header(self.header_line, self.delimiter)
+        log(f"Actual columns: {columns}")
+        return columns
+
+    @cached_property
+    def tail_readable(self):
+        """True if the last line can be read without decompressing the whole file."""
+        if self.compression is None:
+            return True
+        if self.compression == 'gzip' and self.gzip_index:
+            from gzip_index import load_index
+            return load_index(self.file_path) is not None
+        return False
+
+    @cached_property
+    def scan(self):
+        with self.stage('scan', bytes_read=os.path.getsize(self.file_path)) as stage, \
+                Progress(f"Scanning {self.file_path}") as progress:
+            if self.total_columns or self.field_counts:
+                # The same pass, on the same parallel paths, also totals the columns and counts fields
+                scan = scan_with_totals(self.file_path, self.compression, self.total_columns,
+                                        check_delimiter=self.check_delimiter, gzip_index=self.gzip_index,
+                                        workers=self.workers, progress=progress)
+            else:
+                scan = scan_file(self.file_path, self.compression, check_delimiter=self.check_delimiter,
+                                 gzip_index=self.gzip_index, workers=self.workers, progress=progress)
+            stage['rows'] = scan['line_count']
+        return scan
+
+    @cached_property
+    def last_line(self):
+        if not self.tail_readable:
+            # Compressed without an index: the scan streams through the last line anyway
+            return self.scan['last_line']
+        with self.stage('trailer', rows=1):
+            return read_last_line(self.file_path, self.compression)
+
+    @cached_property
+    def trailer_count(self):
+        """Record count from the trailer's third field; raises ValueError or IndexError if absent."""
+        last_row = self.last_line.strip().split(self.delimiter)
+        log(f"Last row: {last_row}")
+        return int(last_row[2])
+
+
+class Rule:
+    """A named check with a declared cost.
+
+    check(facts, verdict) returns None when the file passes or a short
+    failure message; it may fill in verdict fields along the way. cost is
+    a number or a function of the facts, for checks whose price depends
+    on the file (a trailer read is cheap on plain files, not on gzip).
+    """
+
+    def __init__(self, name, cost, check):
+        self.name = name
+        self.cost = cost
+        self.check = check
+
+    def cost_for(self, facts):
+        return self.cost(facts) if callable(self.cost) else self.cost
+
+
+def run_rules(rules, facts, verdict):
+    """Run rules cheapest first; return None if all pass, else the first failure message.
+
+    Rules of equal cost keep their listed order. The failing rule's name
+    is recorded as verdict['failed_rule'].
+    """
+    for rule in sorted(rules, key=lambda rule: rule.cost_for(facts)):
+        message = rule.check(facts, verdict)
+        if message is not None:
+            verdict['failed_rule'] = rule.name
+            return f"{rule.name}: {message}"
+    return None
+
+
+def header_rule(expected_columns):
+    """The header columns must equal the expected columns."""
+    def check(facts, verdict):
+        verdict['header_match'] = facts.header == expected_columns
+        if not verdict['header_match']:
+            return f"columns {facts.header} do not match the expected {expected_columns}"
+    return Rule('header', COST_HEAD, check)
+
+
+def schema_rule(registry):
+    """The header must route to a schema in the registry and equal its columns exactly."""
+    def check(facts, verdict):
+        verdict['schema'], facts.expected_columns = registry.route(facts.header)
+        if facts.expected_columns is None:
+            verdict['header_match'] = False
+            return f"columns {facts.header} match none of the {len(registry)} registered schemas"
+        log(f"Schema: {verdict['schema']}")
+        verdict['header_match'] = facts.header == facts.expected_columns
+        if not verdict['header_match']:
+            return (f"columns {facts.header} do not match the expected {facts.expected_columns} "
+                    f"of schema {verdict['schema']!r}")
+    return Rule('header', COST_HEAD, check)
+
+
+def trailer_rule():
+    """The last row must carry a record count in its third field."""
+    def check(facts, verdict):
+        try:
+            verdict['trailer_count'] = facts.trailer_count
+        except (ValueError, IndexError):
+            return f"last row {facts.last_line.strip()!r} has no record count"
+    return Rule('trailer', lambda facts: COST_TAIL if facts.tail_readable else COST_SCAN, check)
+
+
+def row_count_rule(excluded_lines):
+    """The line count minus excluded_lines (trailer, and header if excluded) must equal the trailer count."""
+    def check(facts, verdict):
+        verdict['total_rows'] = facts.scan['line_count'] - excluded_lines
+        try:
+            trailer_count = facts.trailer_count
+        except (ValueError, IndexError):
+            return "last row has no record count"
+        if verdict['total_rows'] != trailer_count:
+            return f"{verdict['total_rows']} rows but the trailer says {trailer_count}"
+    return Rule('row_count', COST_SCAN, check)
+
+
+def control_total_rule(control_totals):
+    """Each (kind, column, trailer field) control total must equal that field of the trailer.
+
+    'sum' compares the exact decimal sum of the column. 'hash' compares the
+    sum of an integer key column, cut to as many digits as the trailer
+    field has. Trailer fields are numbered from 0, like the record count
+    in field 2. The totals come from the shared scan, whose FileFacts must
+    be given the columns as total_columns.
+    """
+    def check(facts, verdict):
+        for _, column, _ in control_totals:
+            if column not in facts.scan['column_totals']:
+                return f"control total column {column!r} is not in the header"
+        if facts.scan['total_bad_count']:
+            verdict['total_bad_lines'] = facts.scan['total_bad_lines']
+            return (f"{facts.scan['total_bad_count']} line(s) cannot be totalled (wrong field count or "
+                    f"not a number), first at line(s) {facts.scan['total_bad_lines'][:10]}")
+        last_row = facts.last_line.strip().split(facts.delimiter)
+        verdict['control_totals'] = {}
+        for kind, column, field in control_totals:
+            scaled = facts.scan['column_totals'][column]
+            try:
+                expected = Decimal(last_row[field])
+            except (IndexError, InvalidOperation):
+                return f"last row {facts.last_line.strip()!r} has no {kind} of {column} in field {field}"
+            whole, fraction = divmod(scaled, 10 ** TOTAL_DECIMALS)
+            if kind == 'hash' and not fraction:
+                width = len(last_row[field].strip().lstrip('+-'))
+                total = Decimal(whole % 10 ** width)
+            else:
+                # Built from a string, so no digits are lost to the context precision
+                total = Decimal(f"{scaled}E-{TOTAL_DECIMALS}")
+            verdict['control_totals'][f"{kind}:{column}"] = str(total)
+            if total != expected:
+                return f"{kind} of {column} is {total} but the trailer says {last_row[field]}"
+    return Rule('control_totals', COST_SCAN, check)
+
+
+def delimiter_rule():
+    """Every line must contain the delimiter (needs a scan with check_delimiter=True)."""
+    def check(facts, verdict):
+        if facts.scan['bad_line'] is not None:
+            return f"line {facts.scan['bad_line']} has no '{facts.delimiter}' delimiter"
+    return Rule('delimiter', COST_SCAN, check)
+
+
+def field_count_rule():
+    """Every line but the header and trailer must have as many fields as the header.
+
+    schema_rule has already matched the header to the schema's columns, so
+    this is len(expected_columns). The counts come from the shared scan,
+    whose FileFacts must be given field_counts=True. With control totals
+    configured, a line that is not a number is reported by control_total_rule,
+    which runs first.
+    """
+    def check(facts, verdict):
+        if facts.scan['total_bad_count']:
+            verdict['bad_lines'] = facts.scan['total_bad_lines']
+            verdict['bad_line_count'] = facts.scan['total_bad_count']
+            return (f"{facts.scan['total_bad_count']} line(s) do not have {len(facts.header)} fields, "
+                    f"first at line(s) {facts.scan['total_bad_lines'][:10]}")
+    return Rule('field_counts', COST_SCAN, check)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Change-aware scan ledger that replaces the flat scanned_files.txt skip list.
+
+Each validated file is stored in a local SQLite database keyed by path,
+validation method and settings (trailer mode, schema digest, ...),
+together with the size, mtime and inode it had when it was validated. A
+file is skipped only when it was valid last time under the same method and
+settings and all three are unchanged, so a feed overwritten in place under
+the same name, or a run with another mode or edited schemas, validates it
+again. Lookups go through the primary key index and every result is
+committed as soon as it is recorded.
+"""
+
+import json
+import os
+import sqlite3
+import time
+
+LEDGER_PATH = "scanned_files.db"
+LEGACY_PATH = "scanned_files.txt"
+
+
+def ledger_settings(context=None):
+    """Serialize the validator settings a result depends on, as result_cache.cache_key does."""
+    return json.dumps(context or {}, sort_keys=True)
+
+
+def create_table(conn):
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS scanned_files ("
+        " file_path TEXT NOT NULL,"
+        " validation_method TEXT NOT NULL,"
+        " settings TEXT NOT NULL,"
+        " size INTEGER NOT NULL,"
+        " mtime_ns INTEGER NOT NULL,"
+        " inode INTEGER NOT NULL,"
+        " valid INTEGER NOT NULL,"
+        " time_taken REAL,"
+        " scanned_at REAL NOT NULL,"
+        " PRIMARY KEY (file_path, validation_method, settings))"
+    )
+
+
+def migrate_ledger(conn):
+    """Move rows of a ledger keyed by path alone into the current table.
+
+    They keep their method with empty settings, which no current caller
+    uses, so those files are validated once more under their real settings.
+    """
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(scanned_files)")]
+    if not columns or 'settings' in columns:
+        return
+    conn.execute("ALTER TABLE scanned_files RENAME TO scanned_files_v1")
+    create_table(conn)
+    conn.execute(
+        "INSERT INTO scanned_files"
+        " SELECT file_path, COALESCE(validation_method, ''), '', size, mtime_ns, inode, valid,"
+        " time_taken, scanned_at FROM scanned_files_v1"
+    )
+    conn.execute("DROP TABLE scanned_files_v1")
+
+
+def open_ledger(ledger_path=LEDGER_PATH, legacy_path=LEGACY_PATH):
+    """Open (creating or migrating if needed) the ledger database.
+
+    On first use, paths from an old scanned_files.txt are imported with
+    their current stat under the method "legacy". The list never said
+    which validator or settings passed a file, so no run skips them; they
+    are kept for valid_paths.
+    """
+    is_new = not os.path.exists(ledger_path)
+    conn = sqlite3.connect(ledger_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    migrate_ledger(conn)
+    create_table(conn)
+    conn.commit()
+    if is_new and legacy_path and os.path.exists(legacy_path):
+        with open(legacy_path, "r") as f:
+            for file_path in f.read().splitlines():
+                if file_path and os.path.isfile(file_path):
+                    record_result(conn, file_path, True, None, "legacy", commit=False)
+        conn.commit()
+        print(f"Imported {legacy_path} into {ledger_path}")
+    return conn
+
+
+def is_unchanged(conn, file_path, st=None, validation_method=None, context=None):
+    """Return True if the file was valid when last scanned with this method and context and its stat still matches."""
+    row = conn.execute(
+        "SELECT size, mtime_ns, inode, valid FROM scanned_files"
+        " WHERE file_path = ? AND validation_method = ? AND settings = ?",
+        (file_path, validation_method or '', ledger_settings(context)),
+    ).fetchone()
+    if row is None or not row[3]:
+        return False
+    st = st or os.stat(file_path)
+    return (row[0], row[1], row[2]) == (st.st_size, st.st_mtime_ns, st.st_ino)
+
+
+def record_result(conn, file_path, valid, time_taken=None, validation_method=None, st=None, commit=True,
+                  context=None):
+    """Store one validation result under its method and context, stamped with the file's current stat."""
+    st = st or os.stat(file_path)
+    conn.execute(
+        "INSERT OR REPLACE INTO scanned_files"
+        " (file_path, validation_method, settings, size, mtime_ns, inode, valid, time_taken, scanned_at)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (file_path, validation_method or '', ledger_settings(context), st.st_size, st.st_mtime_ns,
+         st.st_ino, int(bool(valid)), time_taken, time.time()),
+    )
+    if commit:
+        conn.commit()
+
+
+def valid_paths(conn):
+    """Return the paths of all files recorded as valid, sorted."""
+    rows = conn.execute("SELECT DISTINCT file_path FROM scanned_files WHERE valid = 1 ORDER BY file_path")
+    return [row[0] for row in rows]
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Expected-column schemas, routed by header fingerprint.
+
+Every validator used to reload expected_columns.txt for each file, and a
+run could only check one layout. A SchemaRegistry holds every schema of a
+run. With a schema directory, each *.txt file in it is one schema, named
+after the file, with one column per line. Without one, the registry holds
+only the expected columns file.
+
+Each schema is indexed by a hash of its normalized header: names
+stripped, BOM removed, case folded. A file is routed to its schema with
+one dict lookup on the fingerprint of its first line. Routing is lenient
+on purpose; the header rule still compares the exact names, so a feed
+that changes the case of a column reaches its schema and is reported
+against it. With a single schema, every file is checked against it
+whatever its header, as before.
+
+load_registry caches the registry per process, keyed on the size and
+mtime of every schema file, so each file costs a stat of the schemas and
+a lookup. A schema added or edited while watch mode runs is picked up by
+the next file. Worker processes forked after the first load inherit it.
+"""
+
+import hashlib
+import json
+import os
+from functools import lru_cache
+
+SCHEMA_EXTENSION = '.txt'
+
+
+def load_expected_columns(file_path):
+    """Load the expected columns from a file, one per line, skipping blank lines."""
+    with open(file_path, 'r') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def normalize_header(columns):
+    """Return the routing form of a header: stripped, BOM-free, case-folded names."""
+    return tuple(column.strip().lstrip('﻿').strip().casefold() for column in columns)
+
+
+def header_fingerprint(columns):
+    """Hash a header's normalized column names."""
+    text = '\x1f'.join(normalize_header(columns))
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class SchemaRegistry:
+    """Named expected-column lists, indexed by header fingerprint."""
+
+    def __init__(self, schemas):
+        if not schemas:
+            raise ValueError("No schemas to register.")
+        self.schemas = dict(schemas)
+        self.by_fingerprint = {}
+        for name, columns in self.schemas.items():
+            key = header_fingerprint(columns)
+            if key in self.by_fingerprint:
+                raise ValueError(f"Schemas {self.by_fingerprint[key]!r} and {name!r} have the same header.")
+            self.by_fingerprint[key] = name
+        # Identifies this set of schemas in result cache keys
+        settings = json.dumps(self.schemas, sort_keys=True)
+        self.digest = hashlib.blake2b(settings.encode('utf-8'), digest_size=16).hexdigest()
+
+    def __len__(self):
+        return len(self.schemas)
+
+    def route(self, columns):
+        """Return (schema name, expected columns) for a header, or (None, None) if none matches."""
+        name = self.by_fingerprint.get(header_fingerprint(columns))
+        if name is None and len(self.schemas) == 1:
+            name = next(iter(self.schemas))
+        if name is None:
+            return None, None
+        return name, self.schemas[name]
+
+
+def schema_signature(schema_dir=None, expected_columns_file=None):
+    """Return the (name, size, mtime) of every schema file, which changes whenever a schema is edited."""
+    if schema_dir:
+        with os.scandir(schema_dir) as entries:
+            return tuple(sorted((entry.name, entry.stat().st_size, entry.stat().st_mtime_ns) for entry in entries
+                                if entry.is_file() and os.path.splitext(entry.name)[1] == SCHEMA_EXTENSION))
+    if expected_columns_file:
+        st = os.stat(expected_columns_file)
+        return ((expected_columns_file, st.st_size, st.st_mtime_ns),)
+    return ()
+
+
+@lru_cache(maxsize=8)
+def read_registry(schema_dir, expected_columns_file, signature):
+    """Load every schema in schema_dir, or the single expected columns file; cached per signature."""
+    schemas = {}
+    if schema_dir:
+        with os.scandir(schema_dir) as entries:
+            for entry in sorted(entries, key=lambda entry: entry.name):
+                name, extension = os.path.splitext(entry.name)
+                if entry.is_file() and extension == SCHEMA_EXTENSION:
+                    schemas[name] = load_expected_columns(entry.path)
+    elif expected_columns_file:
+        name = os.path.splitext(os.path.basename(expected_columns_file))[0]
+        schemas[name] = load_expected_columns(expected_columns_file)
+    return SchemaRegistry(schemas)
+
+
+def load_registry(schema_dir=None, expected_columns_file=None):
+    """Return the registry for schema_dir, or the single expected columns file, reloading it when a schema changes."""
+    return read_registry(schema_dir, expected_columns_file, schema_signature(schema_dir, expected_columns_file))
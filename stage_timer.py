@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Per-stage timing for validate_file.
+
+A StageTimer is created per file and each stage of the validation
+(expected columns, fingerprint, scan, trailer read, ...) runs inside
+timer.stage(name). The stage records its duration, bytes read, rows seen
+and MB/s. When the file is done, emit() appends one JSON line with every
+stage to the timing log. A few perf_counter calls and one appended line per
+file are all it costs, so it can stay on in production.
+
+Read the log with e.g.
+    jq -c '.stages[] | select(.stage == "scan")' stage_timings.jsonl
+"""
+
+import json
+import os
+import time
+from contextlib import contextmanager
+
+TIMING_LOG = "stage_timings.jsonl"
+
+
+class StageTimer:
+    """Collect stage timings for one validation of one file."""
+
+    def __init__(self, file_path, validator):
+        self.file_path = file_path
+        self.validator = validator
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name, bytes_read=None, rows=None):
+        """Time the block as stage `name`; the yielded dict can be updated with bytes or rows seen inside it."""
+        record = {'stage': name, 'bytes': bytes_read, 'rows': rows}
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            elapsed = time.perf_counter() - start
+            record['duration_s'] = round(elapsed, 6)
+            if record['bytes'] and elapsed > 0:
+                record['mb_per_s'] = round(record['bytes'] / (1024 * 1024) / elapsed, 1)
+            self.stages.append(record)
+
+    def emit(self, log_path=TIMING_LOG, **fields):
+        """Append this file's stages as one JSON line; fields (valid, cached, ...) are added to it."""
+        if not log_path:
+            return
+        record = {
+            'file_path': self.file_path,
+            'validator': self.validator,
+            'pid': os.getpid(),
+            'started_at': self.started_at,
+            'total_s': round(time.perf_counter() - self.start, 6),
+            **fields,
+            'stages': self.stages,
+        }
+        # A single append per line, so lines from parallel workers do not interleave
+        with open(log_path, 'a') as f:
+            f.write(json.dumps(record) + "\n")
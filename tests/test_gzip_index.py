@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Regression tests for scans that reuse a gzip checkpoint index.
+
+Run with: python -m pytest -q tests
+"""
+
+import gzip
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gzip_index
+
+
+def write_members(file_path, members):
+    """Write each bytes string as its own gzip member, so every member start can be a checkpoint."""
+    with open(file_path, 'wb') as f:
+        for member in members:
+            f.write(gzip.compress(member))
+
+
+def test_indexed_scan_with_empty_trailing_member(tmp_path):
+    file_path = str(tmp_path / 'feed.psv.gz')
+    write_members(file_path, [b"a|b|c\n1|2|3\n", b"4|5|6\nT|x|2\n", b""])
+    # span=1 puts a checkpoint on every member, the empty one included
+    first = gzip_index.scan_with_index(file_path, span=1, workers=2)
+    index = gzip_index.load_index(file_path)
+    assert index is not None and len(index['checkpoints']) == 3
+    # The second run scans the indexed ranges; the last one inflates nothing
+    assert gzip_index.scan_with_index(file_path, span=1, workers=2) == first
+    assert first['line_count'] == 4
+    assert first['last_line'] == "T|x|2\n"
+    assert first['bad_line'] is None
+
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Trailer (last line) reader for the header/trailer validators.
+
+Plain files are read backwards from EOF in fixed blocks until the start of
+the final record is found, so the cost does not grow with file size.
+Compressed or non-seekable inputs fall back to streaming the whole file,
+except gzip files with a gzip_index sidecar, which inflate from the last
+checkpoint only, and other regular gzip files, which inflate from their
+last member.
+"""
+
+import os
+import stat
+
+from compression_codecs import open_compressed
+
+BLOCK_SIZE = 64 * 1024
+
+
+def seek_last_line(f, block_size=BLOCK_SIZE):
+    """Return the last line of a seekable binary file, reading backwards from EOF.
+
+    The result is the same line that iterating the file would end on: a
+    single trailing newline (LF or CRLF) belongs to the final record, so
+    "a\\nb\\n" gives b"b\\n" and "a\\nb" gives b"b".
+    """
+    end = f.seek(0, os.SEEK_END)
+    if end == 0:
+        return None
+
+    # The final byte is skipped so a terminating newline is kept with the
+    # last record instead of being taken as its start.
+    pos = end - 1
+    while pos > 0:
+        read_size = min(block_size, pos)
+        pos -= read_size
+        f.seek(pos)
+        block = f.read(read_size)
+        newline = block.rfind(b'\n')
+        if newline != -1:
+            start = pos + newline + 1
+            f.seek(start)
+            return f.read(end - start)
+    f.seek(0)
+    return f.read(end)
+
+
+def stream_last_line(f):
+    """Return the last line of a binary file by iterating over every line."""
+    last_line = None
+    for last_line in f:
+        pass
+    return last_line
+
+
+def read_last_line(file_path, compression=None, block_size=BLOCK_SIZE):
+    """Get the last line of the file, seeking from EOF when the file allows it."""
+    if compression is None:
+        with open(file_path, 'rb') as f:
+            if f.seekable():
+                last_line = seek_last_line(f, block_size)
+            else:
+                last_line = stream_last_line(f)
+    else:
+        index = None
+        if compression == 'gzip':
+            from gzip_index import index_last_line, load_index
+            index = load_index(file_path)
+        if index is not None:
+            # Inflate from the last checkpoint instead of from byte 0
+            last_line = index_last_line(file_path, index)
+        elif compression == 'gzip' and stat.S_ISREG(os.stat(file_path).st_mode):
+            from gzip_index import member_last_line
+            last_line = member_last_line(file_path)
+        else:
+            with open_compressed(file_path, compression) as f:
+                last_line = stream_last_line(f)
+    if last_line is None:
+        return None
+    return last_line.decode('utf-8')
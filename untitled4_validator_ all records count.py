@@ -7,174 +7,212 @@ Created on Tue Jun 11 11:04:54 2024
 """
 
 import os
-import pandas as pd
 import time
-from tkinter import Tk
-from tkinter.filedialog import askdirectory, askopenfilename
-
-def detect_delimiter(file_path, compression):
-    """Detect the delimiter used in the file."""
-    print("="*60)
-    print(f"Detecting delimiter in file: {file_path} with compression: {compression}")
-    try:
-        if compression == 'gzip':
-            import gzip
-            with gzip.open(file_path, 'rt') as file:
-                line = file.readline()
-        else:
-            with open(file_path, 'rt') as file:
-                line = file.readline()
-        
-        if ',' in line and '|' in line:
-            raise ValueError("File contains both commas and pipes.")
-        elif ',' in line:
-            delimiter = ','
-        elif '|' in line:
-            delimiter = '|'
-        else:
-            raise ValueError("File does not contain a recognized delimiter.")
-        
-        print("="*60)
-        print(f"Delimiter detected: {delimiter}")
-        return delimiter
-    except Exception as e:
-        print("="*60)
-        print(f"Error detecting delimiter in {file_path}: {e}")
-        return None
-
-def count_rows(file_path, compression, delimiter):
-    """Count the total number of rows in the file efficiently."""
-    print("="*60)
-    print(f"Counting rows in file: {file_path} with compression: {compression}")
-    if compression == 'gzip':
-        import gzip
-        with gzip.open(file_path, 'rt') as f:
-            row_count = sum(1 for _ in f) - 1  # Exclude last row count
-    else:
-        with open(file_path, 'rt') as f:
-            row_count = sum(1 for _ in f) - 1  # Exclude last row count
-    print("="*60)
-    print(f"Total rows (excluding last row): {row_count}")
-    return row_count
-
-def get_last_row(file_path, compression, delimiter):
-    """Get the last row of the file efficiently."""
-    print("="*60)
-    print(f"Getting last row in file: {file_path} with compression: {compression}")
-    if compression == 'gzip':
-        import gzip
-        with gzip.open(file_path, 'rt') as f:
-            last_line = None
-            for last_line in f:
-                pass
-            last_row = last_line.strip().split(delimiter)
-    else:
-        with open(file_path, 'rt') as f:
-            last_line = None
-            for last_line in f:
-                pass
-            last_row = last_line.strip().split(delimiter)
-    print("="*60)
-    print(f"Last row: {last_row}")
-    return last_row
-
-def load_expected_columns(file_path):
-    """Load the expected columns from a file."""
-    print("="*60)
-    print(f"Loading expected columns from file: {file_path}")
-    with open(file_path, 'r') as f:
-        expected_columns = [line.strip() for line in f if line.strip()]  # Read non-empty lines
-    print("="*60)
-    print(f"Expected columns: {expected_columns}")
-    return expected_columns
-
-def validate_file(file_path):
-    """Validate a single CSV or gzip-compressed values file."""
+from compression_codecs import detect_compression
+from fused_engine import DelimiterError
+from parallel_scan import scan_in_order, scan_parallel, walk_files
+from result_cache import cache_key, fingerprint, lookup, open_cache, store
+from stage_timer import StageTimer
+from progress import log, warn
+from rule_pipeline import (FileFacts, control_total_rule, row_count_rule, run_rules, schema_rule,
+                           trailer_rule)
+from schema_registry import load_registry
+
+EXPECTED_COLUMNS_FILE = 'expected_columns.txt'
+# Directory of expected-column files, one schema per file; each file is routed to
+# its schema by header (see schema_registry.py). None checks every file against
+# EXPECTED_COLUMNS_FILE.
+SCHEMA_DIR = None
+# Build and reuse a .gzidx checkpoint sidecar for gzip files (see gzip_index.py)
+USE_GZIP_INDEX = False
+# Reuse verdicts for byte-identical files (see result_cache.py), found by hashing
+# every byte. The sampled hash only reads the head, the tail and a few blocks, so
+# it misses an edit between them and can pass a corrupted copy of a valid file.
+USE_RESULT_CACHE = True
+SAMPLED_HASH_CACHE = False
+# File that per-stage timings of every validation are appended to as JSON lines,
+# e.g. 'stage_timings.jsonl'; None (the default) writes nothing
+TIMING_LOG = None
+# Read the next files ahead while the current ones are validated, which hides
+# network storage latency (see prefetch_scan.py)
+PREFETCH_READS = False
+# Trailer control totals as (kind, column, trailer field) tuples, checked in the
+# counting scan (see control_totals.py): 'sum' for amount columns, 'hash' for
+# integer key columns; fields count from 0, e.g. ('sum', 'amount', 3)
+CONTROL_TOTALS = ()
+VALIDATOR_NAME = 'all records count'
+
+def build_rules(registry):
+    """The checks this validator runs; run_rules orders them by declared cost."""
+    # Trailer count = line count minus the trailer
+    rules = [schema_rule(registry), trailer_rule(), row_count_rule(1)]
+    if CONTROL_TOTALS:
+        rules.append(control_total_rule(CONTROL_TOTALS))
+    return rules
+
+def check_file(file_path, registry, workers=1, timer=None):
+    """Run the header/trailer checks on one file and return its verdict.
+
+    The checks run cheapest first and stop at the first failure, so a
+    wrong header is rejected after reading one line. The header picks
+    the file's schema from the registry. The verdict dict holds valid,
+    schema, header_match, total_rows and trailer_count (plus
+    failed_rule on rejection, and the computed control_totals when
+    CONTROL_TOTALS is set); an 'error' entry marks a verdict that must
+    not be cached. Stage timings go to timer when one is given.
+    """
+    timer = timer or StageTimer(file_path, VALIDATOR_NAME)
+    verdict = {'valid': False, 'schema': None, 'header_match': None, 'total_rows': None, 'trailer_count': None}
     start_time = time.time()
-    print("="*60)
-    print(f"Validating file: {file_path}")
+    log(f"Validating file: {file_path}")
     try:
-        # Determine the compression type based on the file extension
-        compression = 'gzip' if file_path.endswith('.gz') else None
-
-        delimiter = detect_delimiter(file_path, compression)
-        if not delimiter:
-            print("="*60)
-            print(f"Skipping file {file_path} due to delimiter detection error.")
-            return False
-
-        expected_columns_file = 'expected_columns.txt'
-        expected_columns = load_expected_columns(expected_columns_file)
-
-        # Read the first row to get the actual columns
-        first_row = pd.read_csv(file_path, nrows=1, compression=compression, delimiter=delimiter)
-        actual_columns = first_row.columns.tolist()
-        print("="*60)
-        print(f"Actual columns: {actual_columns}")
-
-        total_rows = count_rows(file_path, compression, delimiter)
-        last_row = get_last_row(file_path, compression, delimiter)
-
-        if actual_columns != expected_columns or not last_row or total_rows != int(last_row[2]):
-            print("="*60)
-            print(f"Format error detected in {file_path}")
-            return False
+        # Determine the compression type from the file's magic bytes
+        compression = detect_compression(file_path)
+
+        # The header, trailer and full scan are each read at most once and
+        # only when a rule needs them.
+        facts = FileFacts(file_path, compression, check_delimiter=False, gzip_index=USE_GZIP_INDEX,
+                          workers=workers, timer=timer,
+                          total_columns=[column for _, column, _ in CONTROL_TOTALS])
+        try:
+            failure = run_rules(build_rules(registry), facts, verdict)
+        except DelimiterError as e:
+            # Only a header without a usable delimiter is a verdict on the file; decode, codec
+            # and environment errors fall through to the 'error' verdict below, which is not cached
+            warn(f"Skipping file {file_path} due to delimiter detection error: {e}")
+            return verdict
+        if failure is not None:
+            warn(f"Format error detected in {file_path}: {failure}")
+            return verdict
 
         elapsed_time = time.time() - start_time
-        print("="*60)
-        print(f"Scanned {file_path} successfully. Time taken: {elapsed_time:.2f} seconds")
-        return True
+        log(f"Scanned {file_path} successfully. Time taken: {elapsed_time:.2f} seconds")
+        verdict['valid'] = True
+        return verdict
 
     except Exception as e:
-        print("="*60)
-        print(f"Error reading {file_path}: {e}")
+        warn(f"Error reading {file_path}: {e}")
+        verdict['error'] = str(e)
+        return verdict
+
+def settings_context(registry=None):
+    """The settings a verdict depends on; part of the result cache key and of the scan ledger key."""
+    registry = registry or load_registry(SCHEMA_DIR, EXPECTED_COLUMNS_FILE)
+    return {'validator': VALIDATOR_NAME, 'schemas': registry.digest, 'control_totals': CONTROL_TOTALS}
+
+def validate_file(file_path, workers=1):
+    """Validate a single CSV or compressed (gzip, bz2, xz, zip, zstd) values file.
+
+    workers > 1 splits a large uncompressed file into record-aligned ranges
+    that are counted and checked in parallel. With USE_RESULT_CACHE, a file
+    whose content fingerprint was validated before against the same
+    schemas gets the earlier verdict without being read again.
+    """
+    timer = StageTimer(file_path, VALIDATOR_NAME)
+    try:
+        with timer.stage('schemas'):
+            registry = load_registry(SCHEMA_DIR, EXPECTED_COLUMNS_FILE)
+        if not USE_RESULT_CACHE:
+            verdict = check_file(file_path, registry, workers, timer)
+            timer.emit(TIMING_LOG, valid=verdict['valid'], cached=False)
+            return verdict['valid']
+        with timer.stage('fingerprint'):
+            file_fingerprint = fingerprint(file_path, SAMPLED_HASH_CACHE)
+    except Exception as e:
+        warn(f"Error reading {file_path}: {e}")
+        timer.emit(TIMING_LOG, valid=False, cached=False, error=str(e))
         return False
 
-def scan_directory(directory_path):
-    """Scan all files in a directory."""
-    print("="*60)
-    print(f"Scanning directory: {directory_path}")
-    valid_files = []
-    for root, _, files in os.walk(directory_path):
-        for file in files:
-            file_path = os.path.join(root, file)
-            print("="*60)
-            print(f"Processing file: {file_path}")
-            print("="*60)
-            if validate_file(file_path):
-                valid_files.append(file_path)
-    print("="*60)
-    print(f"Valid files: {valid_files}")
-    return valid_files
+    context = settings_context(registry)
+    key = cache_key(file_fingerprint, context)
+    cache = open_cache()
+    try:
+        with timer.stage('cache_lookup'):
+            verdict = lookup(cache, key)
+        cached = verdict is not None
+        if cached:
+            log(f"Identical content validated before, reusing verdict for {file_path}: {verdict}")
+        else:
+            verdict = check_file(file_path, registry, workers, timer)
+            if 'error' not in verdict:
+                with timer.stage('cache_store'):
+                    store(cache, key, verdict)
+    finally:
+        cache.close()
+    timer.emit(TIMING_LOG, valid=verdict['valid'], cached=cached)
+    return verdict['valid']
+
+def scan_directory(directory_path, workers=1, file_filter=None):
+    """Validate every file in a directory and yield the valid paths as they finish.
+
+    Nothing is collected, so results stream out of directories of any
+    size. The paths come in walk order whatever the worker count (see
+    parallel_scan.scan_in_order), so the saved list is deterministic.
+    file_filter selects the files (see parallel_scan.FileFilter).
+    """
+    log(f"Scanning directory: {directory_path} with {workers} worker(s)")
+    paths = walk_files(directory_path, file_filter)
+    if workers > 1 or PREFETCH_READS:
+        scan = scan_parallel
+        if PREFETCH_READS:
+            # asyncio is only imported when prefetching is on
+            from prefetch_scan import scan_prefetched
+            scan = scan_prefetched
+        for file_path, valid, _ in scan_in_order(scan, paths, validate_file, workers):
+            if valid:
+                yield file_path
+        return
+    for file_path in paths:
+        log(f"Processing file: {file_path}")
+        if validate_file(file_path):
+            yield file_path
 
 def save_valid_files(valid_files):
-    """Save valid scanned files to a text file, only if there are any valid files."""
-    if valid_files:
-        print("="*60)
-        print("Saving valid scanned files to valid_scanned_files.txt")
-        with open("valid_scanned_files.txt", "w") as f:
-            for file in valid_files:
-                f.write(file + "\n")
-        print("="*60)
-        print("Valid scanned file names saved to valid_scanned_files.txt")
+    """Write valid file paths to valid_scanned_files.txt in order as they arrive; created only if there are any."""
+    f = None
+    count = 0
+    try:
+        for file in valid_files:
+            if f is None:
+                log("Saving valid scanned files to valid_scanned_files.txt")
+                f = open("valid_scanned_files.txt", "w")
+            f.write(file + "\n")
+            f.flush()
+            count += 1
+    finally:
+        if f is not None:
+            f.close()
+    if count:
+        log(f"{count} valid scanned file name(s) saved to valid_scanned_files.txt")
     else:
-        print("="*60)
-        print("No valid files to save.")
+        log("No valid files to save.")
+
+def record_watch_result(file_path, valid, elapsed_time):
+    """Append each valid file to valid_scanned_files.txt as soon as watch mode validates it."""
+    log(f"{'Valid' if valid else 'Invalid'} file: {file_path} ({elapsed_time:.2f} seconds)")
+    if valid:
+        with open("valid_scanned_files.txt", "a") as f:
+            f.write(file_path + "\n")
 
 def main():
+    # Imported here so the validation functions also load on headless servers
+    from tkinter import Tk
+    from tkinter.filedialog import askdirectory, askopenfilename
+
     Tk().withdraw()
     print("Do you want to select a file or a directory?")
     print("1. File")
     print("2. Directory")
-    choice = input("Enter 1 for file or 2 for directory: ").strip()
+    print("3. Watch a directory for new files")
+    choice = input("Enter 1 for file, 2 for directory or 3 to watch a directory: ").strip()
 
     if choice == '1':
         path = askopenfilename(title="Select a file")
-    elif choice == '2':
+    elif choice in ('2', '3'):
         path = askdirectory(title="Select a directory")
     else:
         print("="*60)
-        print("Invalid choice. Please run the script again and choose 1 or 2.")
+        print("Invalid choice. Please run the script again and choose 1, 2 or 3.")
         return
 
     if not path:
@@ -182,17 +220,25 @@ def main():
         print("No file or directory selected.")
         return
 
+    if choice == '3':
+        from watch_mode import watch_directory
+        workers = int(input("Number of worker processes (default 1): ").strip() or 1)
+        watch_directory(path, validate_file, on_result=record_watch_result, workers=workers)
+        return
+
     valid_files = []
 
     if os.path.isfile(path):
         print("="*60)
         print(f"Selected path is a file: {path}")
-        if validate_file(path):
+        workers = int(input("Number of worker processes (default 1): ").strip() or 1)
+        if validate_file(path, workers):
             valid_files.append(path)
     elif os.path.isdir(path):
         print("="*60)
         print(f"Selected path is a directory: {path}")
-        valid_files = scan_directory(path)
+        workers = int(input("Number of worker processes (default 1): ").strip() or 1)
+        valid_files = scan_directory(path, workers)
     else:
         print("="*60)
         print("The selected path is neither a file nor a directory.")
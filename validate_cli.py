@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Headless command-line entry point for the validators.
+
+Runs without Tk dialogs or prompts, so it works from cron and on servers
+with no display. Only the validator script the chosen engine needs is
+loaded, so the header/trailer engines never import pandas.
+
+Examples:
+    python validate_cli.py --trailer-mode excluding-header landing/feed.psv.gz
+    python validate_cli.py --trailer-mode all --workers 8 --ledger landing/
+    python validate_cli.py --engine pandas --expected-columns cols.txt landing/
+    python validate_cli.py --trailer-mode all --control-total sum:amount:3 landing/
+"""
+
+import argparse
+import importlib.util
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Header/trailer engines by trailer count semantics (see README, Case 1 / Case 2)
+TRAILER_VALIDATORS = {
+    'all': "untitled4_validator_ all records count.py",
+    'excluding-header': "untitled7_validator_all records count excluding header_1.py",
+}
+PANDAS_VALIDATOR = "validator_pandas_inbuilt_compress_infering_expected_col_file.py"
+
+
+def load_validator(file_name, module_name):
+    """Import one of the validator scripts by path and register it under module_name."""
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(HERE, file_name))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+class ValidatorCall:
+    """Picklable stand-in for validator.validate_file, used by the worker pools.
+
+    module_name is not importable in a fresh process, so under spawn or
+    forkserver a worker could not unpickle the validator's functions, nor
+    would it see the settings applied to the module. This class pickles
+    by reference to validate_cli and carries the parsed arguments; each
+    worker loads and configures the validator from them on first use.
+    """
+
+    def __init__(self, args):
+        self.args = args
+
+    def __call__(self, file_path):
+        from progress import set_quiet
+        set_quiet(not self.args.verbose)
+        return configure_validator(self.args).validate_file(file_path)
+
+
+def iter_paths(paths, file_filter=None):
+    """Yield (path, DirEntry or None) for files named directly and for the filtered files under named directories."""
+    from parallel_scan import walk_entries
+    for path in paths:
+        if os.path.isdir(path):
+            for entry in walk_entries(path, file_filter):
+                yield entry.path, entry
+        elif os.path.isfile(path):
+            yield path, None
+        else:
+            print(f"Not a file or directory: {path}", file=sys.stderr)
+
+
+def build_file_filter(args):
+    """The FileFilter for directory walks from --include/--exclude/--ext/--min-size/--max-size."""
+    from parallel_scan import EXCLUDE_PATTERNS, FileFilter
+    return FileFilter(include=args.include, exclude=EXCLUDE_PATTERNS + tuple(args.exclude),
+                      extensions=args.ext, min_size=args.min_size, max_size=args.max_size)
+
+
+def parse_control_total(spec):
+    """Turn KIND:COLUMN:FIELD into the (kind, column, field) tuple of CONTROL_TOTALS."""
+    kind, _, rest = spec.partition(':')
+    column, _, field = rest.rpartition(':')
+    if kind not in ('sum', 'hash') or not column or not field.isdigit():
+        raise ValueError(f"--control-total {spec!r} is not KIND:COLUMN:FIELD with KIND sum or hash")
+    return kind, column, int(field)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Validate delimited feed files without the interactive dialogs.")
+    parser.add_argument('paths', nargs='+', help="files and/or directories to validate")
+    parser.add_argument('--engine', choices=['trailer', 'pandas'], default='trailer',
+                        help="trailer: streaming header/trailer validator (default); pandas: chunked pandas schema check")
+    parser.add_argument('--csv-engine', choices=['pandas', 'arrow'], default='pandas',
+                        help="parser for the pandas engine: chunked DataFrames (default) or multi-threaded Arrow")
+    parser.add_argument('--memory-budget', type=int, metavar='MB',
+                        help="memory shared by all pandas validations (default: available memory minus 1 GB)")
+    parser.add_argument('--trailer-mode', choices=sorted(TRAILER_VALIDATORS),
+                        help="trailer count semantics: 'all' records, or all records 'excluding-header'")
+    parser.add_argument('--expected-columns', default='expected_columns.txt',
+                        help="file with one expected column name per line (default: expected_columns.txt)")
+    parser.add_argument('--schema-dir',
+                        help="directory of expected column files, one schema each; files are routed by header")
+    parser.add_argument('--include', action='append', default=[], metavar='GLOB',
+                        help="only validate files whose name or path relative to the directory matches (repeatable)")
+    parser.add_argument('--exclude', action='append', default=[], metavar='GLOB',
+                        help="skip files whose name or path relative to the directory matches (repeatable)")
+    parser.add_argument('--ext', action='append', default=[], metavar='SUFFIX',
+                        help="only validate files ending in this suffix, e.g. .psv or .psv.gz (repeatable)")
+    parser.add_argument('--min-size', type=int, metavar='BYTES', help="skip smaller files under directories")
+    parser.add_argument('--max-size', type=int, metavar='BYTES', help="skip larger files under directories")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="worker processes; a single large file is range-split, several files run in parallel")
+    parser.add_argument('--prefetch', action='store_true',
+                        help="read the next files ahead while the current ones are validated (for network storage)")
+    parser.add_argument('--gzip-index', action='store_true', help="build and use .gzidx sidecars for gzip files")
+    parser.add_argument('--no-cache', action='store_true', help="do not reuse verdicts of byte-identical files")
+    parser.add_argument('--no-field-counts', action='store_true',
+                        help="skip the per-row field count check of the excluding-header validator")
+    parser.add_argument('--control-total', action='append', default=[], metavar='KIND:COLUMN:FIELD',
+                        help="check a trailer control total of the trailer engine: KIND is sum or hash, FIELD the "
+                             "0-based trailer field holding it, e.g. sum:amount:3 (repeatable)")
+    parser.add_argument('--sampled-hash', action='store_true',
+                        help="fingerprint cached files from sampled blocks, not every byte (misses edits between them)")
+    parser.add_argument('--ledger', action='store_true',
+                        help="skip files unchanged since they last passed, recording results in scanned_files.db")
+    parser.add_argument('--watch', action='store_true', help="keep running and validate new files as they land")
+    parser.add_argument('--output', default='valid_scanned_files.txt', help="where to write the valid file list")
+    parser.add_argument('--verbose', action='store_true',
+                        help="print every validation step and progress reports; by default only errors and results")
+    parser.add_argument('--timing-log', metavar='PATH',
+                        help="append per-stage timings as JSON lines to this file (default: off)")
+    args = parser.parse_args(argv)
+    if args.engine == 'trailer' and not args.trailer_mode:
+        parser.error("--trailer-mode is required with the trailer engine")
+    try:
+        args.control_totals = tuple(parse_control_total(spec) for spec in args.control_total)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.watch and (len(args.paths) != 1 or not os.path.isdir(args.paths[0])):
+        parser.error("--watch needs exactly one directory")
+    return args
+
+
+def configure_validator(args):
+    """Load the chosen validator script and apply the command-line settings to it."""
+    if args.engine == 'pandas':
+        validator = load_validator(PANDAS_VALIDATOR, 'pandas_validator')
+        validator.CSV_ENGINE = args.csv_engine
+    else:
+        file_name = TRAILER_VALIDATORS[args.trailer_mode]
+        validator = load_validator(file_name, 'trailer_validator_' + args.trailer_mode.replace('-', '_'))
+        validator.USE_GZIP_INDEX = args.gzip_index
+        validator.USE_RESULT_CACHE = not args.no_cache
+        validator.SAMPLED_HASH_CACHE = args.sampled_hash
+        if hasattr(validator, 'CHECK_FIELD_COUNTS'):
+            validator.CHECK_FIELD_COUNTS = not args.no_field_counts
+        validator.CONTROL_TOTALS = args.control_totals
+    validator.EXPECTED_COLUMNS_FILE = os.path.abspath(args.expected_columns)
+    validator.SCHEMA_DIR = args.schema_dir and os.path.abspath(args.schema_dir)
+    validator.TIMING_LOG = args.timing_log and os.path.abspath(args.timing_log)
+    return validator
+
+
+def run_once(args, validator):
+    """Validate every path once; return (valid_count, invalid_count).
+
+    Valid paths are written to args.output as they finish, in the order
+    the paths were given and walked whatever the worker count, so the
+    output is deterministic and nothing accumulates however many files
+    there are. The output file is only created once a file passes.
+    """
+    ledger = None
+    if args.ledger:
+        from scan_ledger import is_unchanged, open_ledger, record_result
+        ledger = open_ledger()
+        # Engine, trailer mode and schemas, so a pass in one setting never skips a file in another
+        context = validator.settings_context()
+
+    stats = {}
+
+    def pending_paths():
+        for file_path, entry in iter_paths(args.paths, build_file_filter(args)):
+            if ledger is not None:
+                # Directory walks reuse the stat cached on the DirEntry
+                st = entry.stat() if entry is not None else os.stat(file_path)
+                if is_unchanged(ledger, file_path, st, args.engine, context):
+                    continue
+                stats[file_path] = st
+            yield file_path
+
+    def results():
+        paths = pending_paths()
+        if args.prefetch:
+            from parallel_scan import scan_in_order
+            from prefetch_scan import scan_prefetched
+            yield from scan_in_order(scan_prefetched, paths, ValidatorCall(args), args.workers)
+            return
+        if args.workers > 1 and not (len(args.paths) == 1 and os.path.isfile(args.paths[0])):
+            from parallel_scan import scan_in_order, scan_parallel
+            yield from scan_in_order(scan_parallel, paths, ValidatorCall(args), args.workers)
+            return
+        for file_path in paths:
+            start_time = time.time()
+            if args.engine == 'trailer':
+                result = validator.validate_file(file_path, args.workers)
+            else:
+                result = validator.validate_file(file_path)
+            valid = result[0] if isinstance(result, tuple) else bool(result)
+            yield file_path, valid, time.time() - start_time
+
+    output = None
+    valid_count = 0
+    invalid_count = 0
+    try:
+        for file_path, valid, elapsed_time in results():
+            if ledger is not None:
+                record_result(ledger, file_path, valid, elapsed_time, args.engine, stats.pop(file_path),
+                              context=context)
+            if valid:
+                if output is None:
+                    output = open(args.output, "w")
+                output.write(file_path + "\n")
+                output.flush()
+                valid_count += 1
+            else:
+                invalid_count += 1
+    finally:
+        if output is not None:
+            output.close()
+        if ledger is not None:
+            ledger.close()
+    return valid_count, invalid_count
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    from progress import set_quiet
+    set_quiet(not args.verbose)
+    if args.memory_budget:
+        import memory_governor
+        memory_governor.MEMORY_BUDGET = args.memory_budget * memory_governor.MB
+    validator = configure_validator(args)
+
+    if args.watch:
+        from watch_mode import IGNORE_PATTERNS, watch_directory
+
+        def on_result(file_path, valid, elapsed_time):
+            print(f"{'VALID' if valid else 'INVALID'} {file_path} {elapsed_time:.2f}s")
+            if valid:
+                with open(args.output, "a") as f:
+                    f.write(file_path + "\n")
+
+        # The output and timing log may be named anything, and may sit in the watched tree
+        outputs = tuple(os.path.basename(path) for path in (args.output, args.timing_log) if path)
+        validate = ValidatorCall(args) if args.workers > 1 else validator.validate_file
+        watch_directory(args.paths[0], validate, on_result=on_result, workers=args.workers,
+                        ignore_patterns=IGNORE_PATTERNS + outputs)
+        return 0
+
+    valid_count, invalid_count = run_once(args, validator)
+    print(f"{valid_count} valid, {invalid_count} invalid file(s)")
+    return 1 if invalid_count else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
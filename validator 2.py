@@ -7,16 +7,27 @@ Created on Tue Jun 11 11:04:54 2024
 """
 import os
 import pandas as pd
-import psutil
 import time
 from tkinter import Tk
 from tkinter.filedialog import askdirectory, askopenfilename
 import duckdb
+from parallel_scan import walk_entries
+from scan_ledger import is_unchanged, open_ledger, record_result
+from compression_codecs import detect_compression, open_compressed, open_text
+from memory_governor import MB, MemoryGovernor
+from progress import Progress, log, warn
+from trailer_reader import read_last_line
+
+# Also report each column's empty-value count, computed in the same DuckDB aggregate query
+DUCKDB_COLUMN_CHECKS = True
+# Whether the trailer's record count (third field) includes the header line, as
+# in untitled4, or counts data rows only, as in untitled7
+TRAILER_COUNTS_HEADER = False
 
 def detect_delimiter(file_path):
     """Detect the delimiter used in the file."""
     try:
-        with open(file_path, 'r', encoding='utf-8') as file:
+        with open_text(file_path, detect_compression(file_path)) as file:
             line = file.readline()
             if ',' in line and '|' in line:
                 raise ValueError("File contains both commas and pipes.")
@@ -27,20 +38,9 @@ def detect_delimiter(file_path):
             else:
                 raise ValueError("File does not contain a recognized delimiter.")
     except Exception as e:
-        print(f"Error detecting delimiter in {file_path}: {e}")
+        warn(f"Error detecting delimiter in {file_path}: {e}")
         return None
 
-def get_dynamic_chunk_size():
-    """Determine chunk size based on available system memory, leaving 1 GB free."""
-    mem = psutil.virtual_memory()
-    available_memory = mem.available  # in bytes
-    reserved_memory = 1 * 1024 * 1024 * 1024  # 1 GB in bytes
-    usable_memory = max(available_memory - reserved_memory, 0)  # Ensure it's not negative
-
-    estimated_row_size = 500  # Estimate the memory required for a single row
-    chunk_size = usable_memory // estimated_row_size  # Calculate the number of rows per chunk
-
-    return chunk_size
 
 def append_to_scanned_files_info(file_path, time_taken, validation_method):
     """Append validation information to scanned_files_info.csv."""
@@ -57,86 +57,127 @@ def validate_file_pandas(file_path):
     try:
         delimiter = detect_delimiter(file_path)
         if delimiter is None:
-            print(f"Skipping file {file_path} due to delimiter detection error.")
+            warn(f"Skipping file {file_path} due to delimiter detection error.")
             return False, 0
 
-        first_chunk = pd.read_csv(file_path, delimiter=delimiter, chunksize=1)
-        header = next(first_chunk).columns
-        print(f"Header detected in {file_path}: {header}")
-        print(f"Delimiter detected: '{delimiter}'")
+        compression = detect_compression(file_path)
+        with open_compressed(file_path, compression) as f:
+            header = next(pd.read_csv(f, delimiter=delimiter, chunksize=1)).columns
+        log(f"Header detected in {file_path}: {header}")
+        log(f"Delimiter detected: '{delimiter}'")
 
-        chunk_size = get_dynamic_chunk_size()
-        print(f"Using dynamic chunk size: {chunk_size:,} rows per chunk")  # Format chunk size with commas
+        governor = MemoryGovernor()
+        log(f"Using adaptive chunks within a {governor.budget / MB:,.0f} MB memory budget")
 
-        for chunk in pd.read_csv(file_path, delimiter=delimiter, chunksize=chunk_size):
-            if chunk.columns.tolist() != header.tolist():
-                print(f"Format error detected in {file_path}")
-                return False, 0
-            print(f"Processed {len(chunk):,} rows")
+        with open_compressed(file_path, compression) as f, Progress(f"Reading {file_path}") as progress:
+            for chunk in governor.chunks(pd.read_csv(f, delimiter=delimiter, chunksize=governor.chunk_size)):
+                if chunk.columns.tolist() != header.tolist():
+                    warn(f"Format error detected in {file_path}")
+                    return False, 0
+                progress.rows += len(chunk)
 
         elapsed_time = time.time() - start_time
-        print(f"Scanned {file_path} successfully with pandas. Time taken: {elapsed_time:.2f} seconds")
+        log(f"Scanned {file_path} successfully with pandas. Time taken: {elapsed_time:.2f} seconds")
 
         append_to_scanned_files_info(file_path, elapsed_time, "pandas")
         return True, elapsed_time
 
     except Exception as e:
-        print(f"Error reading {file_path}: {e}")
+        warn(f"Error reading {file_path}: {e}")
         return False, 0
 
+def quote_identifier(name):
+    """Quote a column name for use in a DuckDB query."""
+    return '"' + str(name).replace('"', '""') + '"'
+
 def validate_file_duckdb(file_path):
-    """Validate a single CSV or pipe-separated values file using DuckDB without SQL."""
+    """Validate a single CSV or pipe-separated values file using DuckDB aggregate queries.
+
+    The header comes from a LIMIT 0 query and the row count (plus, with
+    DUCKDB_COLUMN_CHECKS, each column's non-null count) from a single
+    aggregate query, so DuckDB streams the file and only a few scalars come
+    back to Python, whatever the file size. A last row with a record count
+    in its third field is the trailer. It has fewer fields than the header,
+    so it is read with null_padding and taken off the counts before the row
+    count is compared with the trailer's. Files without a trailer are not
+    rejected for it, as in validate_file_pandas.
+    """
     start_time = time.time()
     try:
         delimiter = detect_delimiter(file_path)
         if delimiter is None:
-            print(f"Skipping file {file_path} due to delimiter detection error.")
+            warn(f"Skipping file {file_path} due to delimiter detection error.")
             return False, 0
 
-        # Read the file using DuckDB
         conn = duckdb.connect(database=':memory:')
-        df = conn.execute(f"SELECT * FROM read_csv_auto('{file_path}', delim='{delimiter}')").fetchdf()
-
-        # Get the header
-        header = df.columns.tolist()
-        print(f"Header detected in {file_path}: {header}")
-
-        chunk_size = get_dynamic_chunk_size()
-        print(f"Using dynamic chunk size: {chunk_size:,} rows per chunk")  # Format chunk size with commas
-
-        offset = 0
-        while offset < len(df):
-            chunk = df.iloc[offset:offset + chunk_size]
-            if chunk.columns.tolist() != header:
-                print(f"Format error detected in {file_path}")
-                return False, 0
-            offset += chunk_size
-            print(f"Processed {len(chunk):,} rows")
+        try:
+            # null_padding keeps the short trailer row from failing the sniffer; all_varchar keeps its
+            # values from failing a typed column, and only counts are needed anyway
+            source = "read_csv_auto($path, delim=$delim, null_padding=true, all_varchar=true)"
+            params = {'path': file_path, 'delim': delimiter}
+
+            # Get the header without reading any rows
+            header = [column[0] for column in conn.execute(f"SELECT * FROM {source} LIMIT 0", params).description]
+            log(f"Header detected in {file_path}: {header}")
+
+            aggregates = ["count(*)"]
+            if DUCKDB_COLUMN_CHECKS:
+                aggregates += [f"count({quote_identifier(column)})" for column in header]
+            counts = conn.execute(f"SELECT {', '.join(aggregates)} FROM {source}", params).fetchone()
+        finally:
+            conn.close()
+
+        # The trailer comes from a tail read (a streamed one for compressed files)
+        trailer = read_last_line(file_path, detect_compression(file_path)).strip().split(delimiter)
+        try:
+            trailer_count = int(trailer[2])
+            log(f"Trailer row: {trailer}")
+        except (ValueError, IndexError):
+            # No record count in the last row, so it is a data row, as validate_file_pandas assumes
+            trailer_count = None
+
+        # count(*) includes the trailer row
+        total_rows = counts[0] - (trailer_count is not None)
+        log(f"Processed {total_rows:,} rows")
+        if DUCKDB_COLUMN_CHECKS:
+            non_null = counts[1:]
+            if trailer_count is not None:
+                # The trailer's padded fields are NULL and its own fields are counted; take both off
+                non_null = [count - (i < len(trailer)) for i, count in enumerate(non_null)]
+            missing = {column: total_rows - count for column, count in zip(header, non_null) if count < total_rows}
+            if missing:
+                log(f"Columns with empty values in {file_path}: {missing}")
+
+        expected_rows = total_rows + 1 if TRAILER_COUNTS_HEADER else total_rows
+        if trailer_count is not None and trailer_count != expected_rows:
+            warn(f"Format error detected in {file_path}: {expected_rows} rows but the trailer says {trailer_count}")
+            return False, 0
 
         elapsed_time = time.time() - start_time
-        print(f"Scanned {file_path} successfully with DuckDB. Time taken: {elapsed_time:.2f} seconds")
+        log(f"Scanned {file_path} successfully with DuckDB. Time taken: {elapsed_time:.2f} seconds")
 
         append_to_scanned_files_info(file_path, elapsed_time, "duckdb")
         return True, elapsed_time
 
     except Exception as e:
-        print(f"Error reading {file_path}: {e}")
+        warn(f"Error reading {file_path}: {e}")
         return False, 0
 
-def scan_directory(directory_path, scanned_files):
-    """Scan all files in a directory."""
+def scan_directory(directory_path, ledger):
+    """Scan all files in a directory, skipping files the ledger shows as unchanged."""
     valid_files = []
-    for root, _, files in os.walk(directory_path):
-        for file in files:
-            file_path = os.path.join(root, file)
-            if file_path in scanned_files:
-                print(f"Skipping already scanned file: {file_path}")
-                continue
-            valid_pandas, _ = validate_file_pandas(file_path)
-            valid_duckdb, _ = validate_file_duckdb(file_path)
-            if valid_pandas and valid_duckdb:
-                valid_files.append((file_path))
-                scanned_files.add(file_path)
+    for entry in walk_entries(directory_path):
+        file_path = entry.path
+        st = entry.stat()
+        if is_unchanged(ledger, file_path, st, "pandas+duckdb"):
+            log(f"Skipping already scanned file: {file_path}")
+            continue
+        valid_pandas, time_pandas = validate_file_pandas(file_path)
+        valid_duckdb, time_duckdb = validate_file_duckdb(file_path)
+        is_valid = valid_pandas and valid_duckdb
+        record_result(ledger, file_path, is_valid, time_pandas + time_duckdb, "pandas+duckdb", st)
+        if is_valid:
+            valid_files.append((file_path))
     return valid_files
 
 def main():
@@ -158,40 +199,27 @@ def main():
         print("No file or directory selected.")
         return
 
-    scanned_files = set()
+    ledger = open_ledger()
     valid_files = []
-    is_exists=False
-
-    if os.path.exists("scanned_files.txt"):
-        with open("scanned_files.txt", "r") as f:
-            scanned_files = set(f.read().splitlines())
 
     if os.path.isfile(path):
-        if path  in scanned_files:
+        st = os.stat(path)
+        if is_unchanged(ledger, path, st, "pandas+duckdb"):
             print(f"Skipping already scanned file: {path}")
-            is_exists=True
         else:
-            valid_pandas, _ = validate_file_pandas(path)
-            valid_duckdb, _ = validate_file_duckdb(path)
-            if valid_pandas and valid_duckdb:
+            valid_pandas, time_pandas = validate_file_pandas(path)
+            valid_duckdb, time_duckdb = validate_file_duckdb(path)
+            is_valid = valid_pandas and valid_duckdb
+            record_result(ledger, path, is_valid, time_pandas + time_duckdb, "pandas+duckdb", st)
+            if is_valid:
                 valid_files.append(path)
     elif os.path.isdir(path):
-        valid_files = scan_directory(path, scanned_files)
+        valid_files = scan_directory(path, ledger)
     else:
         print("The selected path is neither a file nor a directory.")
-    
-    
-    if not is_exists:
-        # Write validated files to scanned_files.txt
-        if not os.path.exists("scanned_files.txt"):
-            with open("scanned_files.txt", "w") as f:
-                for file in valid_files:
-                    f.write(file + "\n")
-        with open("scanned_files.txt", "a") as f:
-            for file in valid_files:
-                f.write(file + "\n")
-    
-        print(f"Scanned files list saved to scanned_files.txt")
+
+    ledger.close()
+    print("Scan results recorded in scanned_files.db")
 
 if __name__ == "__main__":
     main()
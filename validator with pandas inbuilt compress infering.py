@@ -7,15 +7,19 @@ Created on Tue Jun 11 11:04:54 2024
 """
 import os
 import pandas as pd
-import psutil
 import time
 from tkinter import Tk
 from tkinter.filedialog import askdirectory, askopenfilename
+from parallel_scan import walk_entries
+from scan_ledger import is_unchanged, open_ledger, record_result
+from compression_codecs import detect_compression, open_compressed, open_text
+from memory_governor import MB, MemoryGovernor
+from progress import Progress, log, warn
 
 def detect_delimiter(file_path):
     """Detect the delimiter used in the file."""
     try:
-        with open(file_path, 'rt', encoding='utf-8') as file:
+        with open_text(file_path, detect_compression(file_path)) as file:
             line = file.readline()
             if ',' in line and '|' in line:
                 raise ValueError("File contains both commas and pipes.")
@@ -26,20 +30,9 @@ def detect_delimiter(file_path):
             else:
                 raise ValueError("File does not contain a recognized delimiter.")
     except Exception as e:
-        print(f"Error detecting delimiter in {file_path}: {e}")
+        warn(f"Error detecting delimiter in {file_path}: {e}")
         return None
 
-def get_dynamic_chunk_size():
-    """Determine chunk size based on available system memory, leaving 1 GB free."""
-    mem = psutil.virtual_memory()
-    available_memory = mem.available  # in bytes
-    reserved_memory = 4 * 1024 * 1024 * 1024  # 1 GB in bytes
-    usable_memory = max(available_memory - reserved_memory, 0)  # Ensure it's not negative
-
-    estimated_row_size = 500  # Estimate the memory required for a single row
-    chunk_size = usable_memory // estimated_row_size  # Calculate the number of rows per chunk
-
-    return chunk_size
 
 def validate_file(file_path):
     """Validate a single CSV or pipe-separated values file."""
@@ -47,43 +40,46 @@ def validate_file(file_path):
     try:
         delimiter = detect_delimiter(file_path)
         if delimiter is None:
-            print(f"Skipping file {file_path} due to delimiter detection error.")
+            warn(f"Skipping file {file_path} due to delimiter detection error.")
             return False, 0
 
-        first_chunk = pd.read_csv(file_path, delimiter=delimiter, chunksize=1, compression='infer')
-        header = next(first_chunk).columns
-        print(f"Header detected in {file_path}: {header}")
-        print(f"Delimiter detected: '{delimiter}'")
-
-        chunk_size = get_dynamic_chunk_size()
-        print(f"Using dynamic chunk size: {chunk_size:,} rows per chunk")
-
-        for chunk in pd.read_csv(file_path, delimiter=delimiter, chunksize=chunk_size, compression='infer'):
-            if chunk.columns.tolist() != header.tolist():
-                print(f"Format error detected in {file_path}")
-                return False, 0
-            print(f"Processed {len(chunk)} rows")
+        compression = detect_compression(file_path)
+        with open_compressed(file_path, compression) as f:
+            header = next(pd.read_csv(f, delimiter=delimiter, chunksize=1)).columns
+        log(f"Header detected in {file_path}: {header}")
+        log(f"Delimiter detected: '{delimiter}'")
+
+        governor = MemoryGovernor()
+        log(f"Using adaptive chunks within a {governor.budget / MB:,.0f} MB memory budget")
+
+        with open_compressed(file_path, compression) as f, Progress(f"Reading {file_path}") as progress:
+            for chunk in governor.chunks(pd.read_csv(f, delimiter=delimiter, chunksize=governor.chunk_size)):
+                if chunk.columns.tolist() != header.tolist():
+                    warn(f"Format error detected in {file_path}")
+                    return False, 0
+                progress.rows += len(chunk)
         
         elapsed_time = time.time() - start_time
-        print(f"Scanned {file_path} successfully. Time taken: {elapsed_time:.2f} seconds")
+        log(f"Scanned {file_path} successfully. Time taken: {elapsed_time:.2f} seconds")
         return True, elapsed_time
 
     except Exception as e:
-        print(f"Error reading {file_path}: {e}")
+        warn(f"Error reading {file_path}: {e}")
         return False, 0
 
-def scan_directory(directory_path, scanned_files):
-    """Scan all files in a directory."""
+def scan_directory(directory_path, ledger):
+    """Scan all files in a directory, skipping files the ledger shows as unchanged."""
     valid_files = []
-    for root, _, files in os.walk(directory_path):
-        for file in files:
-            file_path = os.path.join(root, file)
-            if file_path in scanned_files:
-                print(f"Skipping already scanned file: {file_path}")
-                continue
-            if validate_file(file_path):
-                valid_files.append(file_path)
-                scanned_files.add(file_path)
+    for entry in walk_entries(directory_path):
+        file_path = entry.path
+        st = entry.stat()
+        if is_unchanged(ledger, file_path, st, "pandas"):
+            log(f"Skipping already scanned file: {file_path}")
+            continue
+        is_valid, time_taken = validate_file(file_path)
+        record_result(ledger, file_path, is_valid, time_taken, "pandas", st)
+        if is_valid:
+            valid_files.append((file_path, time_taken))
     return valid_files
 
 def save_scanned_files_info(scanned_files_info):
@@ -93,7 +89,7 @@ def save_scanned_files_info(scanned_files_info):
         df_existing = pd.read_csv("scanned_files_info.csv")
         df = pd.concat([df_existing, df], ignore_index=True)
     df.to_csv("scanned_files_info.csv", index=False)
-    print("Scanned files information saved to scanned_files_info.csv")
+    log("Scanned files information saved to scanned_files_info.csv")
 
 def main():
     Tk().withdraw()
@@ -114,33 +110,28 @@ def main():
         print("No file or directory selected.")
         return
 
-    scanned_files = set()
+    ledger = open_ledger()
     valid_files = []
 
-    if os.path.exists("scanned_files.txt"):
-        with open("scanned_files.txt", "r") as f:
-            scanned_files = set(f.read().splitlines())
-
     scanned_files_info = []
 
     if os.path.isfile(path):
+        st = os.stat(path)
         is_valid, time_taken = validate_file(path)
+        record_result(ledger, path, is_valid, time_taken, "pandas", st)
         if is_valid:
             valid_files.append(path)
-            scanned_files.add(path)
             scanned_files_info.append((path, time_taken))
     elif os.path.isdir(path):
-        valid_files_info = scan_directory(path, scanned_files)
+        valid_files_info = scan_directory(path, ledger)
         scanned_files_info.extend(valid_files_info)
     else:
         print("The selected path is neither a file nor a directory.")
 
     save_scanned_files_info(scanned_files_info)
 
-    with open("scanned_files.txt", "w") as f:
-        for file in scanned_files:
-            f.write(file + "\n")
-        print("Scanned file names saved to scanned_files.txt")
+    ledger.close()
+    print("Scan results recorded in scanned_files.db")
 
 
 if __name__ == "__main__":
@@ -7,16 +7,24 @@ Created on Tue Jun 11 11:04:54 2024
 """
 import os
 import pandas as pd
-import psutil
 import time
 from tkinter import Tk
 from tkinter.filedialog import askdirectory, askopenfilename, asksaveasfilename
 from tqdm import tqdm
+from parallel_scan import walk_entries
+from scan_ledger import is_unchanged, open_ledger, record_result, valid_paths
+from compression_codecs import detect_compression, open_compressed, open_text
+from memory_governor import MB, MemoryGovernor
+from progress import Progress, log, warn
+
+# 'pandas' reads the file in DataFrame chunks; 'arrow' streams the body through
+# pyarrow's CSV reader on all cores (see arrow_engine.py)
+CSV_ENGINE = 'pandas'
 
 def detect_delimiter(file_path):
     """Detect the delimiter used in the file."""
     try:
-        with open(file_path, 'r', encoding='utf-8') as file:
+        with open_text(file_path, detect_compression(file_path)) as file:
             line = file.readline()
             if ',' in line and '|' in line:
                 raise ValueError("File contains both commas and pipes.")
@@ -27,20 +35,9 @@ def detect_delimiter(file_path):
             else:
                 raise ValueError("File does not contain a recognized delimiter.")
     except Exception as e:
-        print(f"Error detecting delimiter in {file_path}: {e}")
+        warn(f"Error detecting delimiter in {file_path}: {e}")
         return None
 
-def get_dynamic_chunk_size():
-    """Determine chunk size based on available system memory, leaving 1 GB free."""
-    mem = psutil.virtual_memory()
-    available_memory = mem.available  # in bytes
-    reserved_memory = 1 * 1024 * 1024 * 1024  # 1 GB in bytes
-    usable_memory = max(available_memory - reserved_memory, 0)  # Ensure it's not negative
-
-    estimated_row_size = 500  # Estimate the memory required for a single row
-    chunk_size = usable_memory // estimated_row_size  # Calculate the number of rows per chunk
-
-    return chunk_size
 
 def validate_file(file_path):
     """Validate a single CSV or pipe-separated values file."""
@@ -48,44 +45,60 @@ def validate_file(file_path):
     try:
         delimiter = detect_delimiter(file_path)
         if delimiter is None:
-            print(f"Skipping file {file_path} due to delimiter detection error.")
+            warn(f"Skipping file {file_path} due to delimiter detection error.")
             return False
 
-        first_chunk = pd.read_csv(file_path, delimiter=delimiter, chunksize=1)
-        header = next(first_chunk).columns
-        print(f"Header detected in {file_path}: {header}")
-        print(f"Delimiter detected: '{delimiter}'")
-
-        chunk_size = get_dynamic_chunk_size()
-        print(f"Using dynamic chunk size: {chunk_size:,} rows per chunk")
+        compression = detect_compression(file_path)
+        if CSV_ENGINE == 'arrow':
+            from arrow_engine import count_rows_arrow
+            from fused_engine import read_header
+            header = read_header(file_path, delimiter, compression)
+            log(f"Header detected in {file_path}: {header}")
+            log(f"Delimiter detected: '{delimiter}'")
+            with Progress(f"Reading {file_path}") as progress:
+                rows = count_rows_arrow(file_path, delimiter, header, compression, progress=progress)
+            elapsed_time = time.time() - start_time
+            log(f"Scanned {file_path} successfully ({rows:,} rows). Time taken: {elapsed_time:.2f} seconds")
+            return True
+
+        with open_compressed(file_path, compression) as f:
+            header = next(pd.read_csv(f, delimiter=delimiter, chunksize=1)).columns
+        log(f"Header detected in {file_path}: {header}")
+        log(f"Delimiter detected: '{delimiter}'")
+
+        governor = MemoryGovernor()
+        log(f"Using adaptive chunks within a {governor.budget / MB:,.0f} MB memory budget")
 
        
-        for chunk in pd.read_csv(file_path, delimiter=delimiter, chunksize=chunk_size):
-            if chunk.columns.tolist() != header.tolist():
-                print(f"Format error detected in {file_path}")
-                return False
-            print(f"Processed {len(chunk):,} rows")
+        with open_compressed(file_path, compression) as f, Progress(f"Reading {file_path}") as progress:
+            for chunk in governor.chunks(pd.read_csv(f, delimiter=delimiter, chunksize=governor.chunk_size)):
+                if chunk.columns.tolist() != header.tolist():
+                    warn(f"Format error detected in {file_path}")
+                    return False
+                progress.rows += len(chunk)
         elapsed_time = time.time() - start_time
-        print(f"Scanned {file_path} successfully. Time taken: {elapsed_time:.2f} seconds")
+        log(f"Scanned {file_path} successfully. Time taken: {elapsed_time:.2f} seconds")
         return True
 
     except Exception as e:
-        print(f"Error reading {file_path}: {e}")
+        warn(f"Error reading {file_path}: {e}")
         return False
 
 
-def scan_directory(directory_path, scanned_files):
-    """Scan all files in a directory."""
+def scan_directory(directory_path, ledger):
+    """Scan all files in a directory, skipping files the ledger shows as unchanged."""
     valid_files = []
-    for root, _, files in os.walk(directory_path):
-        for file in files:
-            file_path = os.path.join(root, file)
-            if file_path in scanned_files:
-                print(f"Skipping already scanned file: {file_path}")
-                continue
-            if validate_file(file_path):
-                valid_files.append(file_path)
-                scanned_files.add(file_path)
+    for entry in walk_entries(directory_path):
+        file_path = entry.path
+        st = entry.stat()
+        if is_unchanged(ledger, file_path, st, "pandas"):
+            log(f"Skipping already scanned file: {file_path}")
+            continue
+        start_time = time.time()
+        is_valid = validate_file(file_path)
+        record_result(ledger, file_path, is_valid, time.time() - start_time, "pandas", st)
+        if is_valid:
+            valid_files.append(file_path)
     return valid_files
 
 def main():
@@ -107,19 +120,18 @@ def main():
         print("No file or directory selected.")
         return
 
-    scanned_files = set()
+    ledger = open_ledger()
     valid_files = []
 
-    if os.path.exists("scanned_files.txt"):
-        with open("scanned_files.txt", "r") as f:
-            scanned_files = set(f.read().splitlines())
-
     if os.path.isfile(path):
-        if validate_file(path):
+        st = os.stat(path)
+        start_time = time.time()
+        is_valid = validate_file(path)
+        record_result(ledger, path, is_valid, time.time() - start_time, "pandas", st)
+        if is_valid:
             valid_files.append(path)
-            scanned_files.add(path)
     elif os.path.isdir(path):
-        valid_files = scan_directory(path, scanned_files)
+        valid_files = scan_directory(path, ledger)
     else:
         print("The selected path is neither a file nor a directory.")
 
@@ -128,13 +140,11 @@ def main():
         save_path = asksaveasfilename(title="Save scanned files list", defaultextension=".txt", filetypes=[("Text files", "*.txt")])
         if save_path:
             with open(save_path, "w") as f:
-                for file in scanned_files:
+                for file in valid_paths(ledger):
                     f.write(file + "\n")
             print(f"Scanned files list saved to {save_path}")
 
-    with open("scanned_files.txt", "w") as f:
-        for file in scanned_files:
-            f.write(file + "\n")
+    ledger.close()
 
 if __name__ == "__main__":
     main()
@@ -7,15 +7,32 @@ Created on Tue Jun 11 11:04:54 2024
 """
 import os
 import pandas as pd
-import psutil
 import time
-from tkinter import Tk
-from tkinter.filedialog import askdirectory, askopenfilename
+from fused_engine import read_header
+from parallel_scan import scan_in_order, scan_parallel, walk_entries
+from scan_ledger import is_unchanged, open_ledger, record_result
+from compression_codecs import detect_compression, open_compressed, open_text
+from memory_governor import MB, MemoryGovernor
+from progress import Progress, log, warn
+from schema_registry import load_registry
+from stage_timer import StageTimer
+
+EXPECTED_COLUMNS_FILE = 'expected_columns.txt'
+# Directory of expected-column files, one schema per file; each file is routed to
+# its schema by header (see schema_registry.py). None checks every file against
+# EXPECTED_COLUMNS_FILE.
+SCHEMA_DIR = None
+# 'pandas' reads the file in DataFrame chunks; 'arrow' checks the header once and
+# streams the body through pyarrow's CSV reader on all cores (see arrow_engine.py)
+CSV_ENGINE = 'pandas'
+# File that per-stage timings of every validation are appended to as JSON lines,
+# e.g. 'stage_timings.jsonl'; None (the default) writes nothing
+TIMING_LOG = None
 
 def detect_delimiter(file_path):
     """Detect the delimiter used in the file."""
     try:
-        with open(file_path, 'rt', encoding='utf-8') as file:
+        with open_text(file_path, detect_compression(file_path)) as file:
             line = file.readline()
             if ',' in line and '|' in line:
                 raise ValueError("File contains both commas and pipes.")
@@ -26,68 +43,77 @@ def detect_delimiter(file_path):
             else:
                 raise ValueError("File does not contain a recognized delimiter.")
     except Exception as e:
-        print(f"Error detecting delimiter in {file_path}: {e}")
+        warn(f"Error detecting delimiter in {file_path}: {e}")
         return None
 
-def get_dynamic_chunk_size():
-    """Determine chunk size based on available system memory, leaving 1 GB free."""
-    mem = psutil.virtual_memory()
-    available_memory = mem.available  # in bytes
-    reserved_memory = 4 * 1024 * 1024 * 1024  # 1 GB in bytes
-    usable_memory = max(available_memory - reserved_memory, 0)  # Ensure it's not negative
 
-    estimated_row_size = 500  # Estimate the memory required for a single row
-    chunk_size = usable_memory // estimated_row_size  # Calculate the number of rows per chunk
-
-    return chunk_size
-    
-def load_expected_columns(file_path):
-    with open(file_path, 'r') as f:
-        expected_columns = [line.strip() for line in f if line.strip()]  # Read non-empty lines
-    return expected_columns
-
-    """Determine chunk size based on available system memory, leaving 1 GB free."""
-    mem = psutil.virtual_memory()
-    available_memory = mem.available  # in bytes
-    reserved_memory = 4 * 1024 * 1024 * 1024  # 1 GB in bytes
-    usable_memory = max(available_memory - reserved_memory, 0)  # Ensure it's not negative
-
-    estimated_row_size = 500  # Estimate the memory required for a single row
-    chunk_size = usable_memory // estimated_row_size  # Calculate the number of rows per chunk
-
-    return chunk_size
 
 def validate_file(file_path):
     """Validate a single CSV or pipe-separated values file."""
     
     
     start_time = time.time()
+    timer = StageTimer(file_path, 'pandas expected columns')
+    valid = False
     try:
-        delimiter = detect_delimiter(file_path)
+        with timer.stage('delimiter'):
+            delimiter = detect_delimiter(file_path)
         if delimiter is None:
-            print(f"Skipping file {file_path} due to delimiter detection error.")
+            warn(f"Skipping file {file_path} due to delimiter detection error.")
             return False, 0
 
-        expected_columns_file = 'expected_columns.txt'
-        expected_columns = load_expected_columns(expected_columns_file)
-        print(f"Delimiter detected: '{delimiter}'")
+        log(f"Delimiter detected: '{delimiter}'")
 
-        chunk_size = get_dynamic_chunk_size()
-        print(f"Using dynamic chunk size: {chunk_size:,} rows per chunk")
+        compression = detect_compression(file_path)
+        with timer.stage('schema', rows=1):
+            header = read_header(file_path, delimiter, compression)
+            schema, expected_columns = load_registry(SCHEMA_DIR, EXPECTED_COLUMNS_FILE).route(header)
+        if expected_columns is None:
+            warn(f"No registered schema matches the header of {file_path}: {header}")
+            return False, 0
+        log(f"Schema: {schema}")
 
-        for chunk in pd.read_csv(file_path, delimiter=delimiter, chunksize=chunk_size, compression='infer'):
-            if chunk.columns.tolist() != expected_columns:
-                print(f"Format error detected in {file_path}")
+        if CSV_ENGINE == 'arrow':
+            from arrow_engine import count_rows_arrow
+            if header != expected_columns:
+                warn(f"Format error detected in {file_path}")
                 return False, 0
-            print(f"Processed {len(chunk)} rows")
+            with timer.stage('arrow_read', bytes_read=os.path.getsize(file_path)) as stage, \
+                    Progress(f"Reading {file_path}") as progress:
+                stage['rows'] = count_rows_arrow(file_path, delimiter, header, compression, progress=progress)
+            elapsed_time = time.time() - start_time
+            log(f"Scanned {file_path} successfully ({stage['rows']:,} rows). Time taken: {elapsed_time:.2f} seconds")
+            valid = True
+            return True, elapsed_time
+
+        governor = MemoryGovernor()
+        log(f"Using adaptive chunks within a {governor.budget / MB:,.0f} MB memory budget")
+
+        with timer.stage('read_chunks', bytes_read=os.path.getsize(file_path), rows=0) as stage, \
+                open_compressed(file_path, compression) as f, Progress(f"Reading {file_path}") as progress:
+            for chunk in governor.chunks(pd.read_csv(f, delimiter=delimiter, chunksize=governor.chunk_size)):
+                if chunk.columns.tolist() != expected_columns:
+                    warn(f"Format error detected in {file_path}")
+                    return False, 0
+                stage['rows'] += len(chunk)
+                progress.rows += len(chunk)
+            stage['memory_mb'] = round(governor.peak_used / MB, 1)
         
         elapsed_time = time.time() - start_time
-        print(f"Scanned {file_path} successfully. Time taken: {elapsed_time:.2f} seconds")
+        log(f"Scanned {file_path} successfully. Time taken: {elapsed_time:.2f} seconds")
+        valid = True
         return True, elapsed_time
 
     except Exception as e:
-        print(f"Error reading {file_path}: {e}")
+        warn(f"Error reading {file_path}: {e}")
         return False, 0
+    finally:
+        timer.emit(TIMING_LOG, valid=valid)
+
+
+def settings_context():
+    """The settings a ledger entry depends on: the schemas and the CSV engine."""
+    return {'schemas': load_registry(SCHEMA_DIR, EXPECTED_COLUMNS_FILE).digest, 'csv_engine': CSV_ENGINE}
 
 
 def save_scanned_files_info(scanned_files_info):
@@ -97,25 +123,55 @@ def save_scanned_files_info(scanned_files_info):
         df_existing = pd.read_csv("scanned_files_info.csv")
         df = pd.concat([df_existing, df], ignore_index=True)
     df.to_csv("scanned_files_info.csv", index=False)
-    print("Scanned files information saved to scanned_files_info.csv")
+    log("Scanned files information saved to scanned_files_info.csv")
     
     
-def scan_directory(directory_path, scanned_files):
-    """Scan all files in a directory."""
+def scan_directory(directory_path, ledger, workers=1):
+    """Scan all files in a directory, across several worker processes when workers > 1.
+
+    Files the ledger shows as unchanged are skipped, and each result is
+    recorded in the ledger as soon as it comes out. Valid files are
+    returned in walk order whatever the worker count.
+    """
     valid_files = []
-    for root, _, files in os.walk(directory_path):
-        for file in files:
-            file_path = os.path.join(root, file)
-            if file_path in scanned_files:
-                print(f"Skipping already scanned file: {file_path}")
-                continue
-            if validate_file(file_path):
-                valid_files.append(file_path)
-                scanned_files.add(file_path)
+    context = settings_context()
+    if workers > 1:
+        stats = {}
+
+        def changed_paths():
+            for entry in walk_entries(directory_path):
+                file_path = entry.path
+                st = entry.stat()
+                if is_unchanged(ledger, file_path, st, "pandas", context):
+                    log(f"Skipping already scanned file: {file_path}")
+                    continue
+                stats[file_path] = st
+                yield file_path
+
+        # In walk order, so scanned_files_info.csv rows do not depend on which worker finishes first
+        for file_path, is_valid, time_taken in scan_in_order(scan_parallel, changed_paths(), validate_file, workers):
+            record_result(ledger, file_path, is_valid, time_taken, "pandas", stats.pop(file_path), context=context)
+            if is_valid:
+                valid_files.append((file_path, time_taken))
+        return valid_files
+    for entry in walk_entries(directory_path):
+        file_path = entry.path
+        st = entry.stat()
+        if is_unchanged(ledger, file_path, st, "pandas", context):
+            log(f"Skipping already scanned file: {file_path}")
+            continue
+        is_valid, time_taken = validate_file(file_path)
+        record_result(ledger, file_path, is_valid, time_taken, "pandas", st, context=context)
+        if is_valid:
+            valid_files.append((file_path, time_taken))
     return valid_files
 
 
 def main():
+    # Imported here so the validation functions also load on headless servers
+    from tkinter import Tk
+    from tkinter.filedialog import askdirectory, askopenfilename
+
     Tk().withdraw()
     print("Do you want to select a file or a directory?")
     print("1. File")
@@ -134,33 +190,29 @@ def main():
         print("No file or directory selected.")
         return
 
-    scanned_files = set()
+    ledger = open_ledger()
     valid_files = []
 
-    if os.path.exists("scanned_files.txt"):
-        with open("scanned_files.txt", "r") as f:
-            scanned_files = set(f.read().splitlines())
-
     scanned_files_info = []
 
     if os.path.isfile(path):
+        st = os.stat(path)
         is_valid, time_taken = validate_file(path)
+        record_result(ledger, path, is_valid, time_taken, "pandas", st, context=settings_context())
         if is_valid:
             valid_files.append(path)
-            scanned_files.add(path)
             scanned_files_info.append((path, time_taken))
     elif os.path.isdir(path):
-        valid_files_info = scan_directory(path, scanned_files)
+        workers = int(input("Number of worker processes (default 1): ").strip() or 1)
+        valid_files_info = scan_directory(path, ledger, workers)
         scanned_files_info.extend(valid_files_info)
     else:
         print("The selected path is neither a file nor a directory.")
 
     save_scanned_files_info(scanned_files_info)
 
-    with open("scanned_files.txt", "w") as f:
-        for file in scanned_files:
-            f.write(file + "\n")
-        print("Scanned file names saved to scanned_files.txt")
+    ledger.close()
+    print("Scan results recorded in scanned_files.db")
 
     if choice == '1':
         path = askopenfilename(title="Select a file")
@@ -174,33 +226,29 @@ def main():
         print("No file or directory selected.")
         return
 
-    scanned_files = set()
+    ledger = open_ledger()
     valid_files = []
 
-    if os.path.exists("scanned_files.txt"):
-        with open("scanned_files.txt", "r") as f:
-            scanned_files = set(f.read().splitlines())
-
     scanned_files_info = []
 
     if os.path.isfile(path):
+        st = os.stat(path)
         is_valid, time_taken = validate_file(path)
+        record_result(ledger, path, is_valid, time_taken, "pandas", st, context=settings_context())
         if is_valid:
             valid_files.append(path)
-            scanned_files.add(path)
             scanned_files_info.append((path, time_taken))
     elif os.path.isdir(path):
-        valid_files_info = scan_directory(path, scanned_files)
+        workers = int(input("Number of worker processes (default 1): ").strip() or 1)
+        valid_files_info = scan_directory(path, ledger, workers)
         scanned_files_info.extend(valid_files_info)
     else:
         print("The selected path is neither a file nor a directory.")
 
     save_scanned_files_info(scanned_files_info)
 
-    with open("scanned_files.txt", "w") as f:
-        for file in scanned_files:
-            f.write(file + "\n")
-        print("Scanned file names saved to scanned_files.txt")
+    ledger.close()
+    print("Scan results recorded in scanned_files.db")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Watch mode: validate files as they land in a directory tree.
+
+On Linux, inotify reports files that were closed after writing or moved
+into the tree. Elsewhere, or if inotify is unavailable, the tree is polled
+and a file counts as complete once its size and mtime stop changing. In
+both cases a file is only queued after it has been quiet for the debounce
+interval, so producers that reopen and append are not validated half
+written. Ready files go through a bounded work queue to a fixed number of
+validation workers, so a burst of arrivals applies backpressure instead of
+piling up.
+"""
+
+import ctypes
+import ctypes.util
+import fnmatch
+import os
+import queue
+import select
+import struct
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from memory_governor import share_memory_budget, total_memory_budget
+from progress import log, warn
+
+# Temporary and sidecar files, plus the validators' own outputs, which would
+# otherwise be picked up as new arrivals every time a result is written
+IGNORE_PATTERNS = ('.*', '*.tmp', '*.part', '*.gzidx', '*.db', '*.db-*', 'valid_scanned_files.txt',
+                   'scanned_files.txt', 'scanned_files_info.csv', 'stage_timings.jsonl')
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT_HEADER = struct.Struct('iIII')
+
+
+def is_ignored(file_path, ignore_patterns=IGNORE_PATTERNS):
+    """Skip temporary, hidden and sidecar files."""
+    name = os.path.basename(file_path)
+    return any(fnmatch.fnmatch(name, pattern) for pattern in ignore_patterns)
+
+
+def load_inotify():
+    """Return libc with inotify available, or None on platforms without it."""
+    library = ctypes.util.find_library('c')
+    try:
+        libc = ctypes.CDLL(library, use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class InotifySource:
+    """Report written or moved-in files under a directory tree using inotify."""
+
+    def __init__(self, libc, directory_path):
+        self.libc = libc
+        self.fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.dirs = {}
+        for root, _, _ in os.walk(directory_path):
+            self.add_watch(root)
+
+    def add_watch(self, directory_path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory_path), WATCH_MASK)
+        if wd >= 0:
+            self.dirs[wd] = directory_path
+
+    def events(self, timeout):
+        """Yield (path, closed) for events within timeout seconds; closed is False for plain writes."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return
+        data = os.read(self.fd, 64 * 1024)
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                warn("inotify queue overflowed; some arrivals may be picked up late")
+                continue
+            if wd not in self.dirs or not name:
+                continue
+            path = os.path.join(self.dirs[wd], os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self.add_watch(path)
+                    # Files may have landed before the watch existed
+                    for root, dirs, files in os.walk(path):
+                        for directory in dirs:
+                            self.add_watch(os.path.join(root, directory))
+                        for file in files:
+                            yield os.path.join(root, file), True
+                continue
+            yield path, bool(mask & (IN_CLOSE_WRITE | IN_MOVED_TO))
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingSource:
+    """Report new or changed files by polling the tree for size and mtime changes."""
+
+    def __init__(self, directory_path, poll_interval=1.0):
+        self.directory_path = directory_path
+        self.poll_interval = poll_interval
+        self.seen = {}
+
+    def events(self, timeout):
+        time.sleep(min(timeout, self.poll_interval))
+        current = {}
+        for root, _, files in os.walk(self.directory_path):
+            for file in files:
+                path = os.path.join(root, file)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                current[path] = (st.st_size, st.st_mtime_ns)
+                if self.seen.get(path) != current[path]:
+                    # Polling cannot see a close, so completion is left to the debounce
+                    yield path, False
+        self.seen = current
+
+    def close(self):
+        pass
+
+
+def watch_directory(directory_path, validate, on_result=None, workers=1, debounce=2.0,
+                    queue_size=100, poll_interval=1.0, use_inotify=True, stop_event=None,
+                    ignore_patterns=IGNORE_PATTERNS):
+    """Validate files as they arrive under directory_path until interrupted or stop_event is set.
+
+    on_result(file_path, valid, elapsed) is called for every validated
+    file. Files present when watching starts are not validated; run
+    scan_directory first for a backlog. Names matching ignore_patterns
+    are never queued; add any output file the caller writes under the
+    watched tree.
+    """
+    libc = load_inotify() if use_inotify else None
+    if libc is not None:
+        source = InotifySource(libc, directory_path)
+        log(f"Watching {directory_path} with inotify")
+    else:
+        source = PollingSource(directory_path, poll_interval)
+        # Prime the snapshot so existing files are not reported as new
+        for _ in source.events(0):
+            pass
+        log(f"Watching {directory_path} by polling every {poll_interval:.1f} seconds")
+
+    stop_event = stop_event or threading.Event()
+    work_queue = queue.Queue(maxsize=queue_size)
+    pool = None
+    if workers > 1:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=share_memory_budget,
+                                   initargs=(workers, total_memory_budget()))
+
+    def worker():
+        while True:
+            file_path = work_queue.get()
+            if file_path is None:
+                return
+            start_time = time.time()
+            try:
+                if pool is not None:
+                    result = pool.submit(validate, file_path).result()
+                else:
+                    result = validate(file_path)
+                valid = result[0] if isinstance(result, tuple) else bool(result)
+            except Exception as e:
+                warn(f"Error validating {file_path}: {e}")
+                valid = False
+            if on_result is not None:
+                on_result(file_path, valid, time.time() - start_time)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    # path -> [time it becomes ready, closed]; every new event pushes the time back.
+    # With inotify a file must also have been closed (or moved in) to be queued,
+    # so a slow writer that pauses is not validated mid-write.
+    pending = {}
+    needs_close = isinstance(source, InotifySource)
+    try:
+        while not stop_event.is_set():
+            timeout = debounce / 2
+            waiting = [ready_at for ready_at, closed in pending.values() if closed or not needs_close]
+            if waiting:
+                timeout = max(0.0, min(min(waiting) - time.monotonic(), timeout))
+            for path, closed in source.events(timeout):
+                if is_ignored(path, ignore_patterns):
+                    continue
+                entry = pending.setdefault(path, [0.0, False])
+                entry[0] = time.monotonic() + debounce
+                entry[1] = entry[1] or closed
+            now = time.monotonic()
+            for path, (ready_at, closed) in list(pending.items()):
+                if ready_at > now or (needs_close and not closed):
+                    continue
+                del pending[path]
+                if os.path.isfile(path):
+                    # Blocks while the queue is full, so bursts apply backpressure
+                    work_queue.put(path)
+    except KeyboardInterrupt:
+        log("Stopping watch mode")
+    finally:
+        for _ in threads:
+            work_queue.put(None)
+        for thread in threads:
+            thread.join()
+        if pool is not None:
+            pool.shutdown()
+        source.close()